@@ -1,13 +1,31 @@
 import streamlit as st
-from wizard import wizard_ui
-from dashboard import dashboard_ui  # You’ll build this next
-from login import show_login
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import metrics
+from login import logout, show_login, write_session_cookie
 
+# The wizard, dashboard and autosave modules pull in OpenAI, MongoDB and
+# python-docx, so they are imported only once someone is logged in
 
+metrics.start_exporter()
+ctx = get_script_run_ctx()
+if ctx is not None:
+    metrics.session_seen(ctx.session_id)
 
 if "user" not in st.session_state:
     show_login()
-elif st.session_state.get("wizard_complete", False):
-    dashboard_ui()
 else:
-    wizard_ui()
+    import autosave
+
+    write_session_cookie()
+    st.sidebar.button("Log out", on_click=logout)
+    autosave.restore(st.session_state["user"], st.session_state)
+    if st.session_state.get("wizard_complete", False):
+        from dashboard import dashboard_ui
+
+        dashboard_ui()
+    else:
+        from wizard import wizard_ui
+
+        wizard_ui()
+    # Reruns triggered inside the UI skip this; the next run catches up
+    autosave.save(st.session_state["user"], st.session_state)
@@ -0,0 +1,32 @@
+# appdata.py
+"""Where the app keeps files between runs.
+
+APP_DATA_DIR defaults to erdf-tool under $XDG_DATA_HOME (~/.local/share).
+The indexes kept there hold applicants' text, so the directory and files
+are created readable by the app's own user only.
+"""
+
+import os
+
+APP_DATA_DIR = os.getenv("APP_DATA_DIR") or os.path.join(
+    os.getenv("XDG_DATA_HOME")
+    or os.path.join(os.path.expanduser("~"), ".local", "share"),
+    "erdf-tool",
+)
+
+
+def data_path(name):
+    return os.path.join(APP_DATA_DIR, name)
+
+
+def make_private_dir(path):
+    """Create the directory that will hold path, with mode 0700 if new"""
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+
+
+def restrict(path):
+    """Make an existing file readable by its owner only"""
+    try:
+        os.chmod(path, 0o600)
+    except OSError:
+        pass  # missing, or not ours to change
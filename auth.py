@@ -1,33 +1,245 @@
 import os
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import bcrypt
-from pymongo import MongoClient
 from dotenv import load_dotenv
 
+from metrics import AUTH_SECONDS, mongo_listener
+
 load_dotenv()
-client = MongoClient(st.secrets["MONGO_URI"])
-db = client["erdf_auth"]
-users = db["users"]
+
+# Connection pool and timeouts shared by every session in this process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+
+# bcrypt runs on a bounded pool so a burst of logins cannot take every core
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+# Signed session tokens let a reloaded page skip bcrypt entirely
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(12 * 3600)))
+# Password attempts allowed per email within the window
+AUTH_ATTEMPTS_PER_WINDOW = int(os.getenv("AUTH_ATTEMPTS_PER_WINDOW", "5"))
+AUTH_WINDOW_SECONDS = int(os.getenv("AUTH_WINDOW_SECONDS", "60"))
+
+# Per operation: calls, MongoDB round trips and total seconds
+auth_metrics = {}
+# bcrypt jobs waiting for a worker, and the highest that has been seen
+bcrypt_stats = {"queued": 0, "max_queued": 0, "completed": 0}
+_metrics_lock = threading.Lock()
+_bcrypt_pool = ThreadPoolExecutor(
+    max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt"
+)
+_attempts = {}
+_attempts_lock = threading.Lock()
+_attempts_pruned = 0.0
+_fallback_secret = secrets.token_bytes(32)
+
+
+class RateLimitExceeded(Exception):
+    """Too many password attempts for one email"""
+
+
+@st.cache_resource
+def get_client():
+    # pymongo is imported on first use so the login page renders without it
+    from pymongo import MongoClient
+
+    return MongoClient(
+        os.getenv("MONGO_URI") or st.secrets["MONGO_URI"],
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_TIMEOUT_MS,
+        event_listeners=[mongo_listener()],
+    )
+
+
+def get_db():
+    return get_client()["erdf_auth"]
+
+
+@st.cache_resource
+def ensure_indexes():
+    """Create indexes once per process; sign-up relies on the unique email"""
+    get_db()["users"].create_index("email", unique=True)
+    return True
+
+
+def get_users():
+    ensure_indexes()
+    return get_db()["users"]
+
+
+def _record(op, round_trips, started):
+    with _metrics_lock:
+        entry = auth_metrics.setdefault(
+            op, {"calls": 0, "round_trips": 0, "seconds": 0.0}
+        )
+        entry["calls"] += 1
+        entry["round_trips"] += round_trips
+        entry["seconds"] += time.perf_counter() - started
+
+
+def _run_bcrypt(fn, *args):
+    """Run a bcrypt call on the worker pool and wait for its result"""
+
+    def job():
+        with _metrics_lock:
+            bcrypt_stats["queued"] -= 1
+        return fn(*args)
+
+    with _metrics_lock:
+        bcrypt_stats["queued"] += 1
+        bcrypt_stats["max_queued"] = max(
+            bcrypt_stats["max_queued"], bcrypt_stats["queued"]
+        )
+    try:
+        return _bcrypt_pool.submit(job).result()
+    finally:
+        with _metrics_lock:
+            bcrypt_stats["completed"] += 1
 
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return _run_bcrypt(bcrypt.hashpw, password.encode(), bcrypt.gensalt())
 
 
 def check_password(password, hashed):
-    return bcrypt.checkpw(password.encode(), hashed)
+    return _run_bcrypt(bcrypt.checkpw, password.encode(), hashed)
+
 
+def _prune_attempts(now):
+    """Forget emails with no attempt in the current window"""
+    global _attempts_pruned
+    if now - _attempts_pruned < AUTH_WINDOW_SECONDS:
+        return
+    _attempts_pruned = now
+    for email in [
+        email
+        for email, attempts in _attempts.items()
+        if not attempts or now - attempts[-1] > AUTH_WINDOW_SECONDS
+    ]:
+        del _attempts[email]
 
+
+def check_rate_limit(email):
+    """Count an attempt for email; raise once the window's budget is spent"""
+    now = time.monotonic()
+    with _attempts_lock:
+        _prune_attempts(now)
+        attempts = _attempts.setdefault(email.lower(), deque())
+        while attempts and now - attempts[0] > AUTH_WINDOW_SECONDS:
+            attempts.popleft()
+        if len(attempts) >= AUTH_ATTEMPTS_PER_WINDOW:
+            raise RateLimitExceeded(email)
+        attempts.append(now)
+
+
+def _session_secret():
+    secret = os.getenv("SESSION_SECRET")
+    if not secret:
+        try:
+            secret = st.secrets["SESSION_SECRET"]
+        except (KeyError, FileNotFoundError):
+            # Tokens then only survive until this process restarts
+            secret = _fallback_secret
+    return secret.encode() if isinstance(secret, str) else secret
+
+
+def _sign(payload):
+    return hmac.new(_session_secret(), payload, hashlib.sha256).digest()
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def issue_session_token(email):
+    now = time.time()
+    payload = json.dumps(
+        {"email": email, "iat": now, "exp": int(now) + SESSION_TTL_SECONDS}
+    ).encode()
+    return f"{_b64(payload)}.{_b64(_sign(payload))}"
+
+
+def _token_claims(token):
+    """Claims of a genuine, unexpired token, else None"""
+    try:
+        payload_text, signature_text = token.split(".", 1)
+        payload = _unb64(payload_text)
+        if not hmac.compare_digest(_sign(payload), _unb64(signature_text)):
+            return None
+        claims = json.loads(payload)
+    except (ValueError, TypeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+def session_user(token):
+    """Email of a token that is also not revoked by a logout, else None"""
+    claims = _token_claims(token)
+    if not claims:
+        return None
+    from pymongo.errors import PyMongoError
+
+    try:
+        user = get_users().find_one(
+            {"email": claims.get("email")}, {"sessions_valid_after": 1, "_id": 0}
+        )
+    except PyMongoError:
+        return None
+    if user is None or claims.get("iat", 0) < user.get("sessions_valid_after", 0):
+        return None
+    return claims["email"]
+
+
+def revoke_sessions(email):
+    """Invalidate every session token issued to email so far"""
+    get_users().update_one(
+        {"email": email}, {"$set": {"sessions_valid_after": time.time()}}
+    )
+
+
+@AUTH_SECONDS.labels("create_user").time()
 def create_user(email, password):
-    if users.find_one({"email": email}):
-        return False
+    from pymongo.errors import DuplicateKeyError
+
+    check_rate_limit(email)
     hashed = hash_password(password)
-    users.insert_one({"email": email, "password": hashed})
+    started = time.perf_counter()
+    try:
+        # One round trip; the unique index rejects an existing email
+        get_users().insert_one({"email": email, "password": hashed})
+    except DuplicateKeyError:
+        return False
+    finally:
+        _record("create_user", 1, started)
     return True
 
 
+@AUTH_SECONDS.labels("login_user").time()
 def login_user(email, password):
-    user = users.find_one({"email": email})
+    check_rate_limit(email)
+    started = time.perf_counter()
+    try:
+        user = get_users().find_one({"email": email}, {"password": 1, "_id": 0})
+    finally:
+        _record("login_user", 1, started)
     if not user:
         return False
     if check_password(password, user["password"]):
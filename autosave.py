@@ -0,0 +1,225 @@
+# autosave.py
+"""Write-behind autosave of wizard and dashboard state.
+
+The script thread only compares the session's persisted keys with what was
+saved last and queues the fields that changed. A background thread waits
+until a user has been quiet for DRAFT_DEBOUNCE_SECONDS (or until changes
+have waited DRAFT_MAX_DELAY_SECONDS) and writes them with one $set on the
+user's document in erdf_auth.drafts.
+"""
+
+import atexit
+import copy
+import os
+import threading
+import time
+
+from generation import wizard_steps
+from textstore import pack, unpack
+
+DRAFT_DEBOUNCE_SECONDS = float(os.getenv("DRAFT_DEBOUNCE_SECONDS", "2"))
+DRAFT_MAX_DELAY_SECONDS = float(os.getenv("DRAFT_MAX_DELAY_SECONDS", "10"))
+
+# Wizard widgets, navigation and the generated/edited document
+STATE_KEYS = [
+    "org_name",
+    "reg_number",
+    "contact_name",
+    "email",
+    "phone",
+    "lou",
+    "project_idea",
+    "programme",
+    "region",
+    "target_group",
+    "sdg_goals",
+    "risks",
+    "work_packages",
+    "procurement_lou",
+    "step",
+    "wizard_complete",
+    "edited_sections",
+]
+for _i in range(len(wizard_steps)):
+    STATE_KEYS += [f"step_{_i}_input", f"step_{_i}_generated", f"step_{_i}_fingerprint"]
+
+SNAPSHOT_KEY = "_autosave_snapshot"
+RESTORED_KEY = "_draft_restored"
+
+autosave_stats = {
+    "fields_queued": 0,
+    "writes": 0,
+    "fields_written": 0,
+    "errors": 0,
+    "restores": 0,
+    "flush_seconds_total": 0.0,
+    "flush_seconds_max": 0.0,
+    "last_flush_seconds": 0.0,
+}
+
+# user -> {field: value} not yet written, and when the batch started/changed
+_pending = {}
+_first_change = {}
+_last_change = {}
+_cond = threading.Condition()
+_writer = None
+
+
+def get_drafts():
+    from auth import get_db
+
+    return get_db()["drafts"]
+
+
+def changed_fields(state):
+    """Persisted keys whose value differs from the last save of this session"""
+    snapshot = state.get(SNAPSHOT_KEY, {})
+    changes = {}
+    for key in STATE_KEYS:
+        if key in state and snapshot.get(key) != state[key]:
+            changes[key] = copy.deepcopy(state[key])
+    return changes
+
+
+def save(user, state):
+    """Queue this session's changed fields for the background writer"""
+    changes = changed_fields(state)
+    if not changes:
+        return 0
+    snapshot = dict(state.get(SNAPSHOT_KEY, {}))
+    snapshot.update(changes)
+    state[SNAPSHOT_KEY] = snapshot
+    _queue(user, changes)
+    return len(changes)
+
+
+def _queue(user, changes):
+    now = time.monotonic()
+    with _cond:
+        _pending.setdefault(user, {}).update(changes)
+        _first_change.setdefault(user, now)
+        _last_change[user] = now
+        autosave_stats["fields_queued"] += len(changes)
+        _ensure_writer()
+        _cond.notify()
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        _writer = threading.Thread(target=_run, name="autosave", daemon=True)
+        _writer.start()
+
+
+def _due(now):
+    return [
+        user
+        for user in _pending
+        if now - _last_change[user] >= DRAFT_DEBOUNCE_SECONDS
+        or now - _first_change[user] >= DRAFT_MAX_DELAY_SECONDS
+    ]
+
+
+def _take(users):
+    batches = {}
+    for user in users:
+        batches[user] = _pending.pop(user)
+        _first_change.pop(user, None)
+        _last_change.pop(user, None)
+    return batches
+
+
+def _run():
+    while True:
+        with _cond:
+            while True:
+                now = time.monotonic()
+                due = _due(now)
+                if due:
+                    break
+                if _pending:
+                    wake = min(
+                        min(
+                            _last_change[u] + DRAFT_DEBOUNCE_SECONDS,
+                            _first_change[u] + DRAFT_MAX_DELAY_SECONDS,
+                        )
+                        for u in _pending
+                    )
+                    _cond.wait(max(0.0, wake - now))
+                else:
+                    _cond.wait()
+            batches = _take(due)
+        for user, fields in batches.items():
+            _write(user, fields)
+
+
+def _write(user, fields):
+    from pymongo.errors import PyMongoError
+
+    started = time.perf_counter()
+    try:
+        get_drafts().update_one(
+            {"_id": user},
+            {"$set": {f"state.{key}": unpack(value) for key, value in fields.items()}},
+            upsert=True,
+        )
+    except PyMongoError:
+        with _cond:
+            autosave_stats["errors"] += 1
+            # Retry later without overwriting anything newer
+            newer = _pending.get(user, {})
+            _pending[user] = {**fields, **newer}
+            now = time.monotonic()
+            _first_change.setdefault(user, now)
+            _last_change[user] = now
+        return
+    elapsed = time.perf_counter() - started
+    with _cond:
+        autosave_stats["writes"] += 1
+        autosave_stats["fields_written"] += len(fields)
+        autosave_stats["flush_seconds_total"] += elapsed
+        autosave_stats["flush_seconds_max"] = max(
+            autosave_stats["flush_seconds_max"], elapsed
+        )
+        autosave_stats["last_flush_seconds"] = elapsed
+
+
+def flush():
+    """Write every pending change now; used at shutdown"""
+    with _cond:
+        batches = _take(list(_pending))
+    for user, fields in batches.items():
+        _write(user, fields)
+
+
+atexit.register(flush)
+
+
+def restore(user, state):
+    """Load the user's saved draft into a fresh session, once per session"""
+    from pymongo.errors import PyMongoError
+
+    if state.get(RESTORED_KEY):
+        return False
+    state[RESTORED_KEY] = True
+    try:
+        doc = get_drafts().find_one({"_id": user}, {"state": 1})
+    except PyMongoError:
+        with _cond:
+            autosave_stats["errors"] += 1
+        doc = None
+    saved = dict((doc or {}).get("state", {}))
+    with _cond:
+        # Changes from this process that have not been written yet
+        saved.update(copy.deepcopy(_pending.get(user, {})))
+    if not saved:
+        return False
+    # Large texts go back into the session as textstore handles
+    saved = {key: pack(value) for key, value in saved.items()}
+    for key, value in saved.items():
+        if key not in state:
+            state[key] = copy.deepcopy(value)
+    state[SNAPSHOT_KEY] = saved
+    with _cond:
+        autosave_stats["restores"] += 1
+    return True
@@ -0,0 +1,172 @@
+# batch.py
+"""Generate and export ERDF applications in bulk from a JSONL file.
+
+Each line is one application: an object with an optional "id" and the
+wizard fields (org_name, reg_number, contact_name, email, phone, lou,
+project_idea, programme, region, target_group, sdg_goals, risks,
+work_packages, procurement_lou). One DOCX per record is written to the
+output directory. Finished records are logged to progress.jsonl there, so
+re-running the same command after a crash picks up where it stopped.
+
+Drafts are cached in MongoDB when MONGO_URI is set, in the environment or
+in .streamlit/secrets.toml; without it they are cached in memory for this
+run only. --no-cache generates every section afresh.
+
+    python batch.py applications.jsonl --out exports/ --concurrency 4
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import core
+from core import Application
+from docx_export import write_docx
+from generation import wizard_steps
+from metrics import observe_docx, start_exporter, write_textfile
+
+PROGRESS_FILE = "progress.jsonl"
+
+
+def read_records(path):
+    """(record_id, fields) pairs; ids default to the line number"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            fields = json.loads(line)
+            record_id = str(fields.get("id") or f"line-{line_no}")
+            records.append((record_id, fields))
+    return records
+
+
+def output_name(record_id):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", record_id) + ".docx"
+
+
+def load_done(out_dir):
+    """Ids already exported by an earlier run"""
+    done = set()
+    path = os.path.join(out_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn write from a crash
+            if entry.get("status") == "done" and os.path.exists(
+                os.path.join(out_dir, entry["file"])
+            ):
+                done.add(entry["id"])
+    return done
+
+
+def process_record(record_id, fields, out_dir, section_workers, bypass_cache):
+    """Generate all sections for one application and write its DOCX"""
+    app = Application.from_fields(fields)
+    # Each record queues as its own user, so the scheduler interleaves them
+    errors = core.generate(
+        app,
+        max_workers=section_workers,
+        bypass_cache=bypass_cache,
+        user=f"batch:{record_id}",
+    )
+    if errors:
+        failed = ", ".join(f"{wizard_steps[i]}: {e}" for i, e in errors.items())
+        raise RuntimeError(failed)
+
+    file_name = output_name(record_id)
+    fd, tmp = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    started = time.perf_counter()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_docx(app.sections(), f)
+            size = f.tell()
+    except BaseException:
+        os.remove(tmp)
+        raise
+    observe_docx({"write": time.perf_counter() - started}, size)
+    os.replace(tmp, os.path.join(out_dir, file_name))
+    return file_name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file, one application per line")
+    parser.add_argument("--out", default="exports", help="output directory")
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="applications in flight"
+    )
+    parser.add_argument(
+        "--section-concurrency",
+        type=int,
+        default=None,
+        help="sections generated in parallel per application",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="bypass the draft cache"
+    )
+    args = parser.parse_args(argv)
+
+    start_exporter()
+    os.makedirs(args.out, exist_ok=True)
+    records = read_records(args.input)
+    done = load_done(args.out)
+    todo = [(rid, fields) for rid, fields in records if rid not in done]
+    print(
+        f"{len(records)} applications, {len(records) - len(todo)} already "
+        f"exported, {len(todo)} to go"
+    )
+
+    progress = open(os.path.join(args.out, PROGRESS_FILE), "a", encoding="utf-8")
+    started = time.perf_counter()
+    finished = failed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = {
+            pool.submit(
+                process_record,
+                rid,
+                fields,
+                args.out,
+                args.section_concurrency,
+                args.no_cache,
+            ): rid
+            for rid, fields in todo
+        }
+        for future in as_completed(futures):
+            rid = futures[future]
+            try:
+                entry = {"id": rid, "status": "done", "file": future.result()}
+                finished += 1
+            except Exception as e:
+                entry = {"id": rid, "status": "failed", "error": str(e)}
+                failed += 1
+            progress.write(json.dumps(entry) + "\n")
+            progress.flush()
+            elapsed = time.perf_counter() - started
+            print(
+                f"[{finished + failed}/{len(todo)}] {rid}: {entry['status']}"
+                f" | {finished / elapsed * 60:.1f} applications/min"
+            )
+
+    progress.close()
+    write_textfile()
+    elapsed = time.perf_counter() - started
+    print(
+        f"done: {finished} exported, {failed} failed in {elapsed:.1f} s"
+        + (" (re-run to retry failures)" if failed else "")
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# benchmarks/bench_docx_writer.py
+"""Peak memory and time of the streaming DOCX writer against python-docx.
+
+Each engine runs in a fresh process per document size, so peak RSS
+(ru_maxrss) belongs to that one export:
+
+    python-docx   build_document(), save() to memory, getvalue()
+    stream bytes  export_docx(), the writer into a BytesIO
+    stream file   write_docx() straight into a file on disk
+
+Sizes are multiples of the golden corpus per section, seven sections each.
+Before timing, the streamed document.xml body is compared with the
+python-docx one after XML canonicalisation.
+
+    python benchmarks/bench_docx_writer.py [--scales 1,5,25] [--runs 3]
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN = os.path.join(ROOT, "benchmarks", "golden")
+sys.path.insert(0, ROOT)
+
+ENGINES = ["python-docx", "stream bytes", "stream file"]
+
+
+def make_sections(scale):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(GOLDEN, "*.md"))):
+        with open(path, encoding="utf-8", newline="") as f:
+            corpus.append(f.read())
+    content = "\n\n".join(corpus * scale)
+    return [(f"Section {i + 1}", content) for i in range(7)]
+
+
+def peak_rss_mib():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(engine, scale):
+    from docx_export import build_document, export_docx, write_docx
+
+    sections = make_sections(scale)
+    baseline = peak_rss_mib()
+    started = time.perf_counter()
+    if engine == "python-docx":
+        buf = io.BytesIO()
+        build_document(sections).save(buf)
+        size = len(buf.getvalue())
+    elif engine == "stream bytes":
+        size = len(export_docx(sections))
+    else:
+        with tempfile.TemporaryFile() as f:
+            write_docx(sections, f)
+            size = f.tell()
+    elapsed = time.perf_counter() - started
+    print(
+        json.dumps(
+            {
+                "seconds": elapsed,
+                "peak_mib": peak_rss_mib(),
+                "growth_mib": peak_rss_mib() - baseline,
+                "bytes": size,
+            }
+        )
+    )
+
+
+def run_child(engine, scale):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", engine, str(scale)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def body_c14n(data):
+    """Canonical XML of document.xml's body, ignoring indentation"""
+    from lxml import etree
+
+    parser = etree.XMLParser(remove_blank_text=True)
+    with zipfile.ZipFile(io.BytesIO(data)) as package:
+        root = etree.fromstring(package.read("word/document.xml"), parser)
+    return etree.tostring(root[0], method="c14n")
+
+
+def check_equivalent(scale):
+    from docx_export import build_document, export_docx
+
+    sections = make_sections(scale)
+    buf = io.BytesIO()
+    build_document(sections).save(buf)
+    expected, actual = buf.getvalue(), export_docx(sections)
+    with zipfile.ZipFile(io.BytesIO(expected)) as a:
+        with zipfile.ZipFile(io.BytesIO(actual)) as b:
+            same_parts = sorted(a.namelist()) == sorted(b.namelist())
+    return same_parts and body_c14n(expected) == body_c14n(actual)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1,5,25")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return 0
+
+    scales = [int(s) for s in args.scales.split(",")]
+    ok = check_equivalent(scales[0])
+    print(f"{'ok  ' if ok else 'FAIL'} streamed document matches python-docx\n")
+
+    print(
+        f"{'scale':>5} {'engine':<13} {'size':>9} {'median':>9} "
+        f"{'peak RSS':>9} {'growth':>9}"
+    )
+    for scale in scales:
+        for engine in ENGINES:
+            results = [run_child(engine, scale) for _ in range(args.runs)]
+            print(
+                f"{scale:>5} {engine:<13} "
+                f"{results[0]['bytes'] / 1024:>7.0f}KB "
+                f"{statistics.median(r['seconds'] for r in results) * 1000:>7.0f}ms "
+                f"{max(r['peak_mib'] for r in results):>6.0f}MiB "
+                f"{max(r['growth_mib'] for r in results):>6.0f}MiB"
+            )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
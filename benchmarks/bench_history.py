@@ -0,0 +1,161 @@
+# benchmarks/bench_history.py
+"""Correctness check and timing for the revision history.
+
+Runs against the MongoDB stand-in. First, random text pairs are diffed and
+their deltas applied back. Then a section gets --edits small edits, and
+every revision is rebuilt and compared with the text that was saved. Two
+special cases follow: a save racing another session for the same revision
+number (DuplicateKeyError retry), and a save after the section's full
+copies are gone (fresh snapshot). Storage against full copies and rebuild
+and diff times are reported.
+
+    python benchmarks/bench_history.py [--edits 300] [--pairs 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stand_ins  # noqa: E402
+
+stand_ins.install()
+stand_ins.Settings.mongo_latency = 0.0
+os.environ.setdefault("MONGO_URI", "mongodb://stand-in.local")
+
+import history  # noqa: E402
+from history import apply_delta, diff, make_delta  # noqa: E402
+
+WORDS = """project region partners training employment innovation digital small
+business support capacity community local results indicators""".split()
+EDITS = ["", " x ", "new words ", "\n", "\n\n"]
+
+
+def paragraph(rng, words):
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def check_deltas(rng, pairs):
+    failures = 0
+    for _ in range(pairs):
+        old = "\n\n".join(
+            paragraph(rng, rng.randint(0, 30)) for _ in range(rng.randint(0, 4))
+        )
+        chars = list(old)
+        for _ in range(rng.randint(0, 5)):
+            at = rng.randint(0, len(chars))
+            chars[at : at + rng.randint(0, 10)] = rng.choice(EDITS)
+        new = "".join(chars)
+        segments = diff(old, new)
+        failures += (
+            apply_delta(old, make_delta(old, new)) != new
+            or "".join(text for tag, text in segments if tag != "delete") != new
+            or "".join(text for tag, text in segments if tag != "insert") != old
+        )
+    print(f"{'ok  ' if not failures else 'FAIL'} {pairs} deltas applied back")
+    return failures
+
+
+def edit(rng, text):
+    words = text.split(" ")
+    at = rng.randrange(len(words))
+    words[at : at + rng.randint(0, 3)] = paragraph(rng, rng.randint(1, 6)).split(" ")
+    edited = " ".join(words)
+    return edited if edited != text else edited + " extra"
+
+
+def check_rebuild(rng, edits):
+    user, section = "bench@example.com", "Project Summary"
+    text = "\n\n".join(paragraph(rng, 80) for _ in range(8))
+    versions = [text]
+    failures = history.record(user, section, text, "ai") != 0
+    failures += history.record(user, section, text) is not None
+    for rev in range(1, edits + 1):
+        text = edit(rng, text)
+        versions.append(text)
+        failures += history.record(user, section, text) != rev
+    started = time.perf_counter()
+    for rev, text in enumerate(versions):
+        failures += history.text_at(user, section, rev) != text
+    rebuild = (time.perf_counter() - started) / len(versions)
+    print(f"{'ok  ' if not failures else 'FAIL'} {len(versions)} revisions rebuilt")
+
+    stats = history.history_stats
+    full = sum(len(text) for text in versions)
+    print(
+        f"stored: {stats['stored_chars'] / 1024:.0f} KiB in {stats['snapshots']} "
+        f"snapshots and deltas, full copies would be {full / 1024:.0f} KiB "
+        f"({full / stats['stored_chars']:.0f}x)"
+    )
+    started = time.perf_counter()
+    history.diff_html(versions[0], versions[-1])
+    print(
+        f"text_at: {rebuild * 1000:.2f} ms, diff_html of first and last: "
+        f"{(time.perf_counter() - started) * 1000:.2f} ms"
+    )
+    return failures
+
+
+def check_race(rng):
+    """Another session stores the revision number this save computed"""
+    user, section = "race@example.com", "Target Group"
+    revisions = history.get_revisions()
+    first = "\n\n".join(paragraph(rng, 80) for _ in range(4))
+    theirs, ours = edit(rng, first), None
+    history.record(user, section, first)
+    insert_one = revisions.insert_one
+
+    def racing_insert(doc):
+        revisions.insert_one = insert_one
+        other = history._next_revision(revisions, user, section, theirs)
+        other.update(user=user, section=section, at=time.time(), source="edit")
+        insert_one(other)
+        return insert_one(doc)
+
+    revisions.insert_one = racing_insert
+    ours = edit(rng, theirs)
+    rev = history.record(user, section, ours)
+    failures = (
+        rev != 2
+        or history.text_at(user, section, 1) != theirs
+        or history.text_at(user, section, 2) != ours
+    )
+    print(f"{'ok  ' if not failures else 'FAIL'} save retried after a racing save")
+    return failures
+
+
+def check_lost_snapshot(rng):
+    """Saves still work after the section's full copies are deleted"""
+    user, section = "lost@example.com", "Risks"
+    text = "\n\n".join(paragraph(rng, 80) for _ in range(4))
+    history.record(user, section, text)
+    history.record(user, section, edit(rng, text))
+    history.get_revisions().delete_many({"user": user, "snapshot": True})
+    text = edit(rng, text)
+    rev = history.record(user, section, text)
+    failures = rev != 2 or history.text_at(user, section, rev) != text
+    print(f"{'ok  ' if not failures else 'FAIL'} fresh snapshot when none is left")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--edits", type=int, default=300)
+    parser.add_argument("--pairs", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    failures = check_deltas(rng, args.pairs)
+    failures += check_rebuild(rng, args.edits)
+    failures += check_race(rng)
+    failures += check_lost_snapshot(rng)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# benchmarks/bench_markdown.py
+"""Golden-corpus check and timing for the markdown -> DOCX converter.
+
+Each golden/*.md file is converted with process_content_for_docx and its
+document body XML compared with golden/*.xml. The corpus is then repeated
+into one large section and timed, and a seven-section export is timed cold,
+warm, and with one section edited (fragment cache).
+
+    python benchmarks/bench_markdown.py [--repeat 40] [--update]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN = os.path.join(ROOT, "benchmarks", "golden")
+sys.path.insert(0, ROOT)
+
+from docx import Document  # noqa: E402
+
+import docx_export  # noqa: E402
+from docx_export import build_document, process_content_for_docx  # noqa: E402
+from markdown_ast import parse_markdown  # noqa: E402
+
+
+def read(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def render(content):
+    doc = Document()
+    process_content_for_docx(doc, content)
+    return doc.element.body.xml
+
+
+def check_golden(update=False):
+    failures = 0
+    for path in sorted(glob.glob(os.path.join(GOLDEN, "*.md"))):
+        expected_path = path[:-3] + ".xml"
+        actual = render(read(path))
+        if update:
+            with open(expected_path, "w", encoding="utf-8", newline="") as f:
+                f.write(actual)
+            continue
+        ok = actual == read(expected_path)
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {os.path.basename(path)}")
+    return failures
+
+
+def build_directly(sections):
+    """Reference export without the fragment cache"""
+    doc = Document()
+    doc.add_heading("ERDF Application", 0).alignment = 1
+    doc.add_paragraph()
+    for i, (name, content) in enumerate(sections):
+        doc.add_heading(f"{i+1}. {name}", level=1)
+        process_content_for_docx(doc, content)
+        doc.add_paragraph()
+    return doc
+
+
+def time_export(sections):
+    ok = build_document(sections).element.body.xml == (
+        build_directly(sections).element.body.xml
+    )
+    print(f"\n{'ok  ' if ok else 'FAIL'} assembled export matches direct conversion")
+
+    def cold():
+        docx_export.fragment_cache.clear()
+        docx_export.export_docx(sections)
+
+    edited = list(sections)
+
+    def one_edit():
+        name, content = edited[3]
+        edited[3] = (name, content + "\n\nOne more sentence.")
+        docx_export.export_docx(edited)
+
+    print(f"export cold:     {best_of(cold, 3) * 1000:8.1f} ms")
+    print(
+        f"export warm:     {best_of(lambda: docx_export.export_docx(sections), 3) * 1000:8.1f} ms"
+    )
+    print(f"export 1 edited: {best_of(one_edit, 3) * 1000:8.1f} ms")
+    return not ok
+
+
+def best_of(fn, runs):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--update", action="store_true", help="rewrite golden XML")
+    args = parser.parse_args(argv)
+
+    failures = check_golden(update=args.update)
+
+    corpus = "\n\n".join(
+        read(p) for p in sorted(glob.glob(os.path.join(GOLDEN, "*.md")))
+    )
+    big = "\n\n".join([corpus] * args.repeat)
+    parse = best_of(lambda: parse_markdown(big), args.runs)
+    convert = best_of(lambda: render(big), args.runs)
+    print(f"\ninput: {len(big) / 1024:.0f} KiB")
+    print(f"parse only:      {parse * 1000:8.1f} ms")
+    print(f"parse + convert: {convert * 1000:8.1f} ms")
+
+    sections = [(f"Section {i + 1}", "\n\n".join([corpus] * 5)) for i in range(7)]
+    failures += time_export(sections)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
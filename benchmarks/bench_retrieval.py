@@ -0,0 +1,93 @@
+# benchmarks/bench_retrieval.py
+"""Build and query times of the few-shot retrieval index at scale.
+
+Synthetic approved sections are drawn from a Zipf-distributed vocabulary,
+so a few words are everywhere and most are rare, as in real text. All of
+them go into one partition, the worst case for a query. The index is built
+in a temporary directory unless --path is given.
+
+    python benchmarks/bench_retrieval.py [--snippets 100000] [--queries 500]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from retrieval import RetrievalIndex  # noqa: E402
+
+SECTION = "Project Summary"
+# Sections added per transaction, like a burst of approvals
+BATCH = 1000
+
+
+def vocabulary(size, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def sampler(words, rng):
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+
+    def text(count):
+        return " ".join(rng.choices(words, weights, k=count))
+
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippets", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=30000)
+    parser.add_argument("--path", help="index file to build or reuse")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(7)
+    text = sampler(vocabulary(args.vocabulary, rng), rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = RetrievalIndex(args.path or os.path.join(tmp, "index.sqlite3"))
+        have = index.count(SECTION)
+        started = time.perf_counter()
+        for start in range(have, args.snippets, BATCH):
+            # One paragraph per section, so each section is one snippet
+            count = min(BATCH, args.snippets - start)
+            index.add([(SECTION, text(rng.randint(60, 120))) for _ in range(count)])
+        build = time.perf_counter() - started
+        if args.snippets > have:
+            print(
+                f"built {args.snippets - have} snippets in {build:.1f} s "
+                f"({(args.snippets - have) / build:.0f}/s)"
+            )
+        path = args.path or os.path.join(tmp, "index.sqlite3")
+        size = os.path.getsize(path) / 1024**2
+        print(f"index: {index.count(SECTION)} snippets, {size:.0f} MiB on disk")
+
+        for label, words in [("short", 12), ("typical", 60), ("long", 250)]:
+            samples = []
+            for _ in range(args.queries):
+                query = text(words)
+                started = time.perf_counter()
+                index.search(SECTION, query, k=2)
+                samples.append(time.perf_counter() - started)
+            samples.sort()
+            print(
+                f"query {label:<8} ({words:>3} words): "
+                f"p50 {statistics.median(samples) * 1000:6.2f} ms  "
+                f"p95 {samples[int(len(samples) * 0.95)] * 1000:6.2f} ms  "
+                f"max {samples[-1] * 1000:6.2f} ms"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# benchmarks/bench_session_memory.py
+"""Per-session memory of section text, before and after textstore.
+
+Builds the session state of --sessions finished applications and measures
+it with tracemalloc. Before: every input, draft and edit is a str in the
+session, and the full preview holds a text area (a second copy) for each
+section. After: Application.to_state() keeps texts of TEXT_OFFLOAD_MIN_CHARS
+or more as handles into the shared store and the preview has no editor
+open. A --shared fraction of sessions gets drafts another session already
+has, as when several applicants start from the same inputs.
+
+    python benchmarks/bench_session_memory.py [--sessions 200] [--shared 0.25]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core import STEPS, Application, section_name  # noqa: E402
+from textstore import store  # noqa: E402
+
+WORDS = """project region partners training employment innovation digital small
+business support capacity community local results indicators budget risk
+mitigation communication stakeholders target group needs challenges skills
+sustainable growth energy transition activities outcomes monitoring
+evaluation management structure policy equality procurement timeline""".split()
+
+
+def paragraphs(rng, words):
+    text, left = [], words
+    while left > 0:
+        count = min(left, rng.randint(40, 90))
+        text.append(" ".join(rng.choices(WORDS, k=count)).capitalize() + ".")
+        left -= count
+    return "\n\n".join(text)
+
+
+def fresh(text):
+    """An equal but separate str, as text arrives from a request or widget"""
+    return text.encode("utf-8").decode("utf-8")
+
+
+def application(rng, pool, shared):
+    inputs = {i: paragraphs(rng, rng.randint(60, 150)) for i in STEPS}
+    if pool and rng.random() < shared:
+        drafts = rng.choice(pool)
+    else:
+        drafts = {i: paragraphs(rng, rng.randint(500, 900)) for i in STEPS}
+        pool.append(drafts)
+    return inputs, drafts
+
+
+def before_state(inputs, drafts):
+    state = {"edited_sections": {}}
+    for i in STEPS:
+        state[f"step_{i}_input"] = fresh(inputs[i])
+        state[f"step_{i}_generated"] = fresh(drafts[i])
+        state["edited_sections"][section_name(i)] = state[f"step_{i}_generated"]
+        state[f"full_preview_edit_{i}"] = fresh(drafts[i])
+    return state
+
+
+def after_state(inputs, drafts):
+    app = Application()
+    for i in STEPS:
+        app.inputs[i] = fresh(inputs[i])
+        app.record(i, fresh(drafts[i]))
+    state = {}
+    app.to_state(state)
+    return state
+
+
+def measure(build, apps):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    sessions = [build(inputs, drafts) for inputs, drafts in apps]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return sessions, used
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--shared", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    rng, pool = random.Random(3), []
+    apps = [application(rng, pool, args.shared) for _ in range(args.sessions)]
+    chars = sum(
+        len(inputs[i]) + len(drafts[i]) for inputs, drafts in apps for i in STEPS
+    )
+
+    before, before_bytes = measure(before_state, apps)
+    del before
+    after, after_bytes = measure(after_state, apps)
+    report = store.report()
+
+    n = args.sessions
+    print(
+        f"{n} sessions, {len(pool)} distinct drafts, {chars / n / 1024:.0f} KiB text each"
+    )
+    print(f"before: {before_bytes / n / 1024:8.1f} KiB per session")
+    print(f"after:  {after_bytes / n / 1024:8.1f} KiB per session (store included)")
+    print(
+        f"store:  {report['entries']} texts, {report['handles']} handles, "
+        f"{report['compressed_bytes'] / 1024:.0f} KiB compressed, "
+        f"{report['hot_entries']} hot"
+    )
+    del after
+    gc.collect()
+    left = store.report()["entries"]
+    print(f"after sessions end: {left} texts stored")
+    return 1 if left else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# benchmarks/bench_startup.py
+"""Cold-start and login-page time-to-interactive for app.py.
+
+Every measurement runs in a fresh Python process so nothing is warm:
+
+    import      time to import the modules behind each page
+    login page  process start -> first AppTest run of app.py finished
+
+It also lists which heavy packages the login page ended up importing; with
+lazy loading none of openai, pymongo or docx should be there.
+
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["openai", "pymongo", "docx", "bcrypt", "streamlit_extras"]
+
+
+def child(mode):
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    if mode == "login page":
+        from streamlit.testing.v1 import AppTest
+
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    else:
+        for name in mode.split(","):
+            __import__(name)
+    elapsed = time.perf_counter() - started
+    loaded = [name for name in HEAVY if name in sys.modules]
+    print(json.dumps({"seconds": elapsed, "loaded": loaded}))
+
+
+def measure(mode, runs):
+    samples, loaded = [], []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return samples, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child)
+        return 0
+
+    cases = [
+        ("import login", "login"),
+        ("import wizard", "wizard"),
+        ("import dashboard", "dashboard"),
+        ("login page", "login page"),
+    ]
+    print(f"{'case':<18} {'median':>8} {'min':>8} {'max':>8}  heavy modules loaded")
+    for label, mode in cases:
+        samples, loaded = measure(mode, args.runs)
+        print(
+            f"{label:<18} {statistics.median(samples) * 1000:>6.0f}ms "
+            f"{min(samples) * 1000:>6.0f}ms {max(samples) * 1000:>6.0f}ms  "
+            f"{', '.join(loaded) or '-'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
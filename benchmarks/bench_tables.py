@@ -0,0 +1,99 @@
+# benchmarks/bench_tables.py
+"""Bulk table builder against python-docx's row-by-row API.
+
+For each table size a work-package/budget style markdown table is converted
+with add_table() (one w:tbl built and parsed in a single pass) and with the
+previous approach of table.add_row() plus cell.text per cell. The two
+bodies are compared first; aligned columns are then timed on their own.
+Every timing includes opening a blank Document (about 10 ms).
+
+    python benchmarks/bench_tables.py [--rows 10,100,1000] [--runs 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from docx import Document  # noqa: E402
+
+from docx_export import add_table  # noqa: E402
+from markdown_ast import parse_table  # noqa: E402
+
+
+def markdown_table(rows, separator="|---|---|---|---|"):
+    lines = ["| Work package | Lead partner | Months | Budget (EUR) |", separator]
+    for i in range(rows):
+        lines.append(
+            f"| WP{i + 1} Activity & delivery {i} | Partner {chr(65 + i % 26)} "
+            f"| {1 + i % 36} | {(i + 1) * 12500:,} |"
+        )
+    return "\n".join(lines)
+
+
+def add_table_row_by_row(doc, headers, rows):
+    """Reference: the per-row, per-cell python-docx calls"""
+    table = doc.add_table(rows=1, cols=len(headers))
+    table.style = "Table Grid"
+    table.autofit = True
+    hdr_cells = table.rows[0].cells
+    for i, header in enumerate(headers):
+        hdr_cells[i].text = header
+        for paragraph in hdr_cells[i].paragraphs:
+            for run in paragraph.runs:
+                run.bold = True
+    for cols in rows:
+        row_cells = table.add_row().cells
+        for i, cell_content in enumerate(cols):
+            row_cells[i].text = cell_content
+    return table
+
+
+def best_of(fn, runs):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10,100,1000")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'rows':>6} {'row by row':>11} {'bulk':>9} {'aligned':>9} {'speedup':>8}")
+    for count in [int(n) for n in args.rows.split(",")]:
+        _, headers, rows, _ = parse_table(markdown_table(count))
+        aligned = parse_table(markdown_table(count, "|:---|:---:|---:|---:|"))
+
+        old, new = Document(), Document()
+        add_table_row_by_row(old, headers, rows)
+        add_table(new, headers, rows)
+        if old.element.body.xml != new.element.body.xml:
+            print(f"FAIL {count} rows: bulk table differs from row-by-row")
+            failures += 1
+
+        slow = best_of(
+            lambda: add_table_row_by_row(Document(), headers, rows), args.runs
+        )
+        fast = best_of(lambda: add_table(Document(), headers, rows), args.runs)
+        with_aligns = best_of(
+            lambda: add_table(Document(), aligned[1], aligned[2], aligns=aligned[3]),
+            args.runs,
+        )
+        print(
+            f"{count:>6} {slow * 1000:>9.1f}ms {fast * 1000:>7.1f}ms "
+            f"{with_aligns * 1000:>7.1f}ms {slow / fast:>7.1f}x"
+        )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+# benchmarks/loadtest.py
+"""Concurrent-session load test for app.py.
+
+Drives N simulated applicants through login -> seven wizard steps -> submit
+-> dashboard -> DOCX export using Streamlit's AppTest, with OpenAI and
+MongoDB replaced by the local stand-ins in stand_ins.py. All sessions share
+one Python process, as they would on a single Streamlit server.
+
+    python benchmarks/loadtest.py --sessions 20 --concurrency 10
+"""
+
+import argparse
+import contextlib
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stand_ins  # noqa: E402
+
+stand_ins.install()
+
+import streamlit as st  # noqa: E402
+from streamlit.runtime import Runtime  # noqa: E402
+from streamlit.runtime.secrets import Secrets  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1 import app_test as app_test_module  # noqa: E402
+from streamlit.testing.v1.util import patch_config_options  # noqa: E402
+
+STAGES = ["login", "wizard", "submit", "dashboard", "export"]
+
+
+class _KeepFirstInstance(type):
+    def __setattr__(cls, name, value):
+        if name != "_instance":
+            super().__setattr__(name, value)
+        elif value is not None and Runtime._instance is None:
+            Runtime._instance = value
+
+
+class _SharedRuntime(Runtime, metaclass=_KeepFirstInstance):
+    """Stands in for Runtime inside AppTest.
+
+    AppTest installs and clears a process-global mock runtime around every
+    run, which breaks as soon as two sessions run at once. Through this class
+    the first mock stays installed and is shared by every session.
+    """
+
+
+_app_test_config = patch_config_options({"global.appTest": True})
+
+
+def _share_runtime():
+    app_test_module.Runtime = _SharedRuntime
+    # AppTest also flips the global "global.appTest" option on and off around
+    # each run, so one session finishing switched it off under the others.
+    # Keep it on for the whole load test instead.
+    _app_test_config.__enter__()
+    app_test_module.patch_config_options = lambda options: contextlib.nullcontext()
+
+
+def _install_secrets():
+    secrets = Secrets()
+    secrets._secrets = {
+        "OPENAI_API_KEY": "stand-in",
+        "MONGO_URI": "mongodb://stand-in.local",
+    }
+    st.secrets = secrets
+
+
+def _widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+def _check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at
+
+
+def run_session(n, timeout):
+    """One applicant; returns {stage: seconds}"""
+    timings = {}
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=timeout)
+    email, password = f"applicant{n}@example.com", "correct horse"
+
+    started = time.perf_counter()
+    _check(at.run())
+    _widget(at.radio, "Select Mode").set_value("Sign Up")
+    _widget(at.text_input, "Email").input(email)
+    _widget(at.text_input, "Password").input(password)
+    _check(_widget(at.button, "Submit").click().run())
+    _widget(at.radio, "Select Mode").set_value("Login")
+    _check(_widget(at.button, "Submit").click().run())
+    if "user" not in at.session_state:
+        raise RuntimeError("login failed")
+    timings["login"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    at.text_input(key="org_name").input(f"Organisation {n}")
+    at.text_input(key="reg_number").input(f"556{n:06d}")
+    at.text_input(key="contact_name").input("Alex Applicant")
+    at.text_input(key="email").input(email)
+    at.text_input(key="phone").input("+46 70 000 00 00")
+    _check(_widget(at.button, "Next ▶").click().run())
+    at.text_area(key="project_idea").input("Digital twins for regional SMEs.")
+    _check(_widget(at.button, "Next ▶").click().run())
+    at.multiselect(key="region").set_value(["Region North", "Region East"])
+    _check(_widget(at.button, "Next ▶").click().run())
+    at.text_area(key="target_group").input("Manufacturing SMEs with < 50 staff.")
+    _check(_widget(at.button, "Next ▶").click().run())
+    at.multiselect(key="sdg_goals").set_value(["Goal 9"])
+    at.multiselect(key="risks").set_value(["Budget overrun", "Tech delays"])
+    _check(_widget(at.button, "Next ▶").click().run())
+    _check(_widget(at.button, "Add Pilot Lab").click().run())
+    _check(_widget(at.button, "Next ▶").click().run())
+    at.radio(key="procurement_lou").set_value("Yes")
+    _check(at.run())
+    timings["wizard"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _check(_widget(at.button, "✅ Submit All & Generate Document").click().run())
+    if not at.session_state["wizard_complete"]:
+        raise RuntimeError("generation failed")
+    timings["submit"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _check(at.run())
+    timings["dashboard"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _check(_widget(at.button, "⬇️ Download as DOCX").click().run())
+    if not at.get("download_button"):
+        raise RuntimeError("export produced no download")
+    timings["export"] = time.perf_counter() - started
+    return timings
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(results, failures, elapsed):
+    print(f"\n{'stage':<10} {'n':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'mean':>8}")
+    for stage in STAGES:
+        values = results[stage]
+        if not values:
+            continue
+        print(
+            f"{stage:<10} {len(values):>4} "
+            f"{percentile(values, 50):>8.3f} {percentile(values, 95):>8.3f} "
+            f"{percentile(values, 99):>8.3f} {statistics.mean(values):>8.3f}"
+        )
+    completed = len(results["export"])
+    print(f"\ncompleted sessions: {completed}, failed: {len(failures)}")
+    print(
+        f"wall time: {elapsed:.2f} s, throughput: {completed / elapsed:.2f} sessions/s"
+    )
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS: {peak_kb / 1024:.1f} MiB")
+    from autosave import autosave_stats as stats
+
+    if stats["writes"]:
+        print(
+            f"autosave: {stats['writes']} writes, {stats['fields_written']} fields, "
+            f"flush mean {stats['flush_seconds_total'] / stats['writes'] * 1000:.1f} ms, "
+            f"max {stats['flush_seconds_max'] * 1000:.1f} ms, errors {stats['errors']}"
+        )
+    from cache import stats as cache_stats
+
+    joined = cache_stats["flights"] + cache_stats["coalesced"]
+    if joined:
+        print(
+            f"generation: {cache_stats['flights']} upstream calls, "
+            f"{cache_stats['coalesced']} coalesced "
+            f"({cache_stats['coalesced'] / joined:.0%} of cache misses)"
+        )
+    from scheduler import scheduler_stats
+
+    if scheduler_stats["granted"]:
+        print(
+            f"scheduler: {scheduler_stats['granted']} granted, max queue "
+            f"{scheduler_stats['max_queued']}, mean wait "
+            f"{scheduler_stats['wait_seconds_total'] / scheduler_stats['granted']:.2f} s, "
+            f"{scheduler_stats['retries']} retries "
+            f"({scheduler_stats['rate_limited']} rate limited)"
+        )
+    from token_budget import usage_totals
+
+    tokens = usage_totals()
+    if tokens["calls"]:
+        print(
+            f"tokens: {tokens['calls']} calls, {tokens['prompt_tokens']} prompt, "
+            f"{tokens['completion_tokens']} completion, {tokens['total_tokens']} total"
+        )
+    for n, error in failures[:5]:
+        print(f"session {n} failed: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--openai-latency", type=float, default=2.0)
+    parser.add_argument("--openai-jitter", type=float, default=0.5)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-429-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--mongo-latency", type=float, default=0.005)
+    parser.add_argument("--mongo-error-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    stand_ins.Settings.openai_latency = args.openai_latency
+    stand_ins.Settings.openai_jitter = args.openai_jitter
+    stand_ins.Settings.openai_error_rate = args.openai_error_rate
+    stand_ins.Settings.openai_rate_limit_rate = args.openai_429_rate
+    stand_ins.Settings.tokens_per_second = args.tokens_per_second
+    stand_ins.Settings.mongo_latency = args.mongo_latency
+    stand_ins.Settings.mongo_error_rate = args.mongo_error_rate
+
+    _install_secrets()
+    _share_runtime()
+    os.chdir(ROOT)
+
+    results = defaultdict(list)
+    failures = []
+    lock = threading.Lock()
+
+    def one(n):
+        try:
+            timings = run_session(n, args.timeout)
+        except Exception as e:
+            if args.verbose:
+                traceback.print_exc()
+            with lock:
+                failures.append((n, e))
+            return
+        with lock:
+            for stage, seconds in timings.items():
+                results[stage].append(seconds)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    from autosave import flush
+
+    flush()
+    report(results, failures, elapsed)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
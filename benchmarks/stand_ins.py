@@ -0,0 +1,280 @@
+# benchmarks/stand_ins.py
+"""Local stand-ins for the OpenAI client and MongoDB used by the benchmarks.
+
+install() patches openai.OpenAI and pymongo.MongoClient, so it must run
+before the app modules are imported.
+"""
+
+import copy
+import itertools
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pymongo
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+
+SAMPLE_SECTION = """## Overview
+
+**{step}** builds on the applicant's input and sets out the approach.
+
+### Objectives
+
+1. Strengthen regional SME capacity
+2. Pilot digital services with local partners
+3. Share results across the region
+
+| Work package | Lead | Budget |
+|---|---|---|
+| WP1 Needs analysis | Partner A | 120 000 |
+| WP2 Pilot lab | Partner B | 340 000 |
+
+- Risk is monitored *quarterly* by the steering group
+- Results are published under `CC-BY`
+"""
+
+
+class Settings:
+    """Latency and error knobs shared by every stand-in"""
+
+    openai_latency = 2.0
+    openai_jitter = 0.5
+    openai_error_rate = 0.0
+    openai_rate_limit_rate = 0.0
+    openai_retry_after = 0.5
+    tokens_per_second = 200.0
+    mongo_latency = 0.005
+    mongo_error_rate = 0.0
+
+
+def _sleep(mean, jitter=0.0):
+    time.sleep(max(0.0, random.uniform(mean - jitter, mean + jitter)))
+
+
+def _maybe_fail(rate, make_error):
+    if rate and random.random() < rate:
+        raise make_error()
+
+
+def _openai_error():
+    request = httpx.Request("POST", "https://stand-in.local/v1/chat/completions")
+    return openai.APIConnectionError(message="simulated OpenAI error", request=request)
+
+
+def _rate_limit_error():
+    request = httpx.Request("POST", "https://stand-in.local/v1/chat/completions")
+    response = httpx.Response(
+        429,
+        headers={"retry-after": str(Settings.openai_retry_after)},
+        request=request,
+    )
+    return openai.RateLimitError("simulated rate limit", response=response, body=None)
+
+
+class _Completions:
+    def create(self, model, messages, stream=False, max_tokens=1000, **kwargs):
+        step = next(
+            (
+                m["content"].rsplit("section '", 1)[1].split("'", 1)[0]
+                for m in messages
+                if "section '" in m["content"]
+            ),
+            "section",
+        )
+        text = SAMPLE_SECTION.format(step=step)
+        words = text.split(" ")
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(words),
+            total_tokens=prompt_tokens + len(words),
+        )
+        _maybe_fail(Settings.openai_error_rate, _openai_error)
+        _maybe_fail(Settings.openai_rate_limit_rate, _rate_limit_error)
+        if not stream:
+            _sleep(Settings.openai_latency, Settings.openai_jitter)
+            message = SimpleNamespace(content=text, role="assistant")
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=message, finish_reason="stop")],
+                usage=usage,
+                model=model,
+            )
+        return self._stream(words, usage)
+
+    def _stream(self, words, usage):
+        # Time to first token, then a steady token rate
+        _sleep(Settings.openai_latency / 4, Settings.openai_jitter / 4)
+        for i, word in enumerate(words):
+            time.sleep(1.0 / Settings.tokens_per_second)
+            content = word if i == 0 else " " + word
+            delta = SimpleNamespace(content=content, role=None)
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None
+            )
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+class FakeOpenAI:
+    def __init__(self, *args, **kwargs):
+        self.chat = SimpleNamespace(completions=_Completions())
+
+
+_OPERATORS = {
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+}
+
+
+def _matches(doc, query):
+    for field, value in query.items():
+        if isinstance(value, dict) and value and set(value) <= set(_OPERATORS):
+            if not all(_OPERATORS[op](doc.get(field), b) for op, b in value.items()):
+                return False
+        elif doc.get(field) != value:
+            return False
+    return True
+
+
+def _sorted(docs, sort):
+    for field, direction in reversed(sort or []):
+        docs = sorted(docs, key=lambda doc: doc.get(field), reverse=direction < 0)
+    return docs
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    keep = {f for f, on in projection.items() if on}
+    return {f: copy.deepcopy(v) for f, v in doc.items() if f in keep or f == "_id"}
+
+
+def _apply_set(doc, fields):
+    # Dotted paths ("state.step") set nested fields, as MongoDB does
+    for path, value in fields.items():
+        *parents, leaf = path.split(".")
+        target = doc
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = copy.deepcopy(value)
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        # Field tuples of the unique indexes
+        self.unique_keys = {("_id",)}
+        self.ops = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _op(self):
+        self.ops += 1
+        _sleep(Settings.mongo_latency)
+        _maybe_fail(Settings.mongo_error_rate, lambda: AutoReconnect("simulated"))
+
+    def create_index(self, keys, unique=False, **kwargs):
+        fields = (keys,) if isinstance(keys, str) else tuple(f for f, _ in keys)
+        if unique:
+            self.unique_keys.add(fields)
+        return "_".join(f"{field}_1" for field in fields)
+
+    def _check_unique(self, doc, ignore=None):
+        for fields in self.unique_keys:
+            if not all(field in doc for field in fields):
+                continue
+            for other in self.docs:
+                if other is not ignore and all(
+                    other.get(field) == doc[field] for field in fields
+                ):
+                    raise DuplicateKeyError(f"E11000 duplicate key: {fields}")
+
+    def find_one(self, query=None, projection=None, sort=None, **kwargs):
+        self._op()
+        with self._lock:
+            docs = [doc for doc in self.docs if _matches(doc, query or {})]
+            for doc in _sorted(docs, sort):
+                return _project(doc, projection)
+        return None
+
+    def find(self, query=None, projection=None, sort=None, **kwargs):
+        self._op()
+        with self._lock:
+            docs = [doc for doc in self.docs if _matches(doc, query or {})]
+            return [_project(doc, projection) for doc in _sorted(docs, sort)]
+
+    def delete_many(self, query):
+        self._op()
+        with self._lock:
+            kept = [doc for doc in self.docs if not _matches(doc, query)]
+            deleted = len(self.docs) - len(kept)
+            self.docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def insert_one(self, doc):
+        self._op()
+        with self._lock:
+            doc.setdefault("_id", f"{self.name}-{next(self._ids)}")
+            self._check_unique(doc)
+            self.docs.append(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    def update_one(self, query, update, upsert=False, **kwargs):
+        self._op()
+        with self._lock:
+            for doc in self.docs:
+                if _matches(doc, query):
+                    _apply_set(doc, update.get("$set", {}))
+                    return SimpleNamespace(matched_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, upserted_id=None)
+            doc = dict(query)
+            _apply_set(doc, update.get("$setOnInsert", {}))
+            _apply_set(doc, update.get("$set", {}))
+            doc.setdefault("_id", f"{self.name}-{next(self._ids)}")
+            self._check_unique(doc)
+            self.docs.append(doc)
+            return SimpleNamespace(matched_count=0, upserted_id=doc["_id"])
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name)
+            return self._collections[name]
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+
+class FakeMongoClient:
+    _databases = {}
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        self.admin = SimpleNamespace(command=lambda *a, **k: {"ok": 1})
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = FakeDatabase()
+            return self._databases[name]
+
+    def close(self):
+        pass
+
+
+def install():
+    """Swap the real clients for the stand-ins"""
+    openai.OpenAI = FakeOpenAI
+    pymongo.MongoClient = FakeMongoClient
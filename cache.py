@@ -0,0 +1,302 @@
+# cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# In-process tier: number of drafts kept per Streamlit process
+CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_SIZE", "512"))
+# Shared tier: how long a draft lives in MongoDB before the TTL index drops it
+CACHE_TTL_SECONDS = int(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+# How long a caller sharing a call waits for its next chunk before giving up
+FLIGHT_WAIT_SECONDS = float(os.getenv("FLIGHT_WAIT_SECONDS", "300"))
+
+stats = {
+    "memory_hits": 0,
+    "mongo_hits": 0,
+    "misses": 0,
+    "bypassed": 0,
+    "mongo_errors": 0,
+    # Shared calls started, and requests that joined one already in flight
+    "flights": 0,
+    "coalesced": 0,
+}
+_stats_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+
+def cache_key(step_name, user_input, model, temperature, max_tokens):
+    """Content address of a generation request"""
+    payload = json.dumps(
+        [step_name, user_input, model, temperature, max_tokens], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Bounded, thread-safe least-recently-used map"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    while it runs wait for, or stream along with, the leader's result. If the
+    leader stops reading early, the work still finishes for the others.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                _count("flights")
+                return flight, True
+            flight.followers += 1
+        _count("coalesced")
+        return flight, False
+
+    def _finish(self, key, flight, error=None):
+        with self._lock:
+            self._flights.pop(key, None)
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+
+    def _publish(self, flight, chunk):
+        with flight.cond:
+            flight.chunks.append(chunk)
+            flight.cond.notify_all()
+
+    def _drain(self, key, flight, chunks):
+        try:
+            for chunk in chunks:
+                self._publish(flight, chunk)
+        except Exception as e:
+            self._finish(key, flight, e)
+            return
+        self._finish(key, flight)
+
+    def _abandon(self, key, flight, chunks):
+        """The leader's consumer stopped reading, e.g. on a Streamlit rerun.
+
+        Callers sharing the flight still get the whole result: the rest of
+        chunks is read on a background thread. Without any, the call stops.
+        """
+        with self._lock:
+            if flight.followers:
+                threading.Thread(
+                    target=self._drain,
+                    args=(key, flight, chunks),
+                    name="single-flight",
+                    daemon=True,
+                ).start()
+                return
+            self._flights.pop(key, None)
+        if hasattr(chunks, "close"):
+            chunks.close()
+        self._finish(key, flight, GeneratorExit())
+
+    def do(self, key, fn):
+        """fn()'s result, computed once for all concurrent callers of key"""
+        return "".join(self.stream(key, lambda: iter([fn()])))
+
+    def stream(self, key, produce):
+        """Yield the chunks of produce() (a generator function), shared by key"""
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                chunks = produce()
+                for chunk in chunks:
+                    self._publish(flight, chunk)
+                    yield chunk
+            except GeneratorExit:
+                self._abandon(key, flight, chunks)
+                raise
+            except BaseException as e:
+                self._finish(key, flight, e)
+                raise
+            self._finish(key, flight)
+            return
+        try:
+            yield from self._follow(flight)
+        finally:
+            with self._lock:
+                flight.followers -= 1
+
+    def _follow(self, flight):
+        seen = 0
+        while True:
+            with flight.cond:
+                while seen == len(flight.chunks) and not flight.done:
+                    # A stuck leader must not hold its followers forever
+                    if not flight.cond.wait(FLIGHT_WAIT_SECONDS):
+                        raise TimeoutError(
+                            f"shared generation stalled for {FLIGHT_WAIT_SECONDS:g} s"
+                        )
+                chunks = flight.chunks[seen:]
+                done, error = flight.done, flight.error
+            seen += len(chunks)
+            yield from chunks
+            if done and seen == len(flight.chunks):
+                if error is not None:
+                    raise RuntimeError(f"shared generation failed: {error!r}")
+                return
+
+
+memory_cache = LRUCache(CACHE_MAX_ENTRIES)
+flights = SingleFlight()
+_collection = None
+_collection_lock = threading.Lock()
+_unconfigured = False
+
+
+def get_collection():
+    """Shared cache collection, created with its TTL index on first use.
+
+    None when MongoDB is not configured; drafts are then cached in memory.
+    """
+    global _collection, _unconfigured
+    if _collection is None and not _unconfigured:
+        with _collection_lock:
+            if _collection is None and not _unconfigured:
+                from auth import get_db
+
+                try:
+                    collection = get_db()["generation_cache"]
+                except (KeyError, FileNotFoundError):
+                    # No MONGO_URI in the environment or Streamlit secrets,
+                    # as when batch.py runs outside Streamlit
+                    logger.warning(
+                        "MONGO_URI is not set; drafts are cached in memory only"
+                    )
+                    _unconfigured = True
+                    return None
+                collection.create_index(
+                    "created_at", expireAfterSeconds=CACHE_TTL_SECONDS
+                )
+                _collection = collection
+    return _collection
+
+
+def get(key):
+    from pymongo.errors import PyMongoError
+
+    text = memory_cache.get(key)
+    if text is not None:
+        _count("memory_hits")
+        return text
+    try:
+        collection = get_collection()
+        if collection is not None:
+            doc = collection.find_one({"_id": key}, {"text": 1})
+        else:
+            doc = None
+    except PyMongoError:
+        _count("mongo_errors")
+        doc = None
+    if doc:
+        _count("mongo_hits")
+        memory_cache.put(key, doc["text"])
+        return doc["text"]
+    _count("misses")
+    return None
+
+
+def put(key, text):
+    from pymongo.errors import PyMongoError
+
+    memory_cache.put(key, text)
+    try:
+        collection = get_collection()
+        if collection is None:
+            return
+        collection.update_one(
+            {"_id": key},
+            {"$set": {"text": text, "created_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    except PyMongoError:
+        _count("mongo_errors")
+
+
+def lookup(key, bypass=False, refresh=False):
+    """Stored value for key, unless the caller bypasses or refreshes the cache"""
+    if bypass:
+        _count("bypassed")
+        return None
+    if refresh:
+        return None
+    return get(key)
+
+
+def cached_call(key, produce, bypass=False, refresh=False):
+    """Return the cached value for key, or call produce() and store its result.
+
+    bypass skips the cache entirely; refresh ignores stored values but still
+    stores the fresh result. Either way, identical calls already in flight
+    are joined rather than repeated.
+    """
+    text = lookup(key, bypass=bypass, refresh=refresh)
+    if text is not None:
+        return text
+
+    def produce_and_store():
+        # A call for the same key may have finished since the lookup
+        text = None if bypass or refresh else memory_cache.get(key)
+        if text is None:
+            text = produce()
+            if not bypass:
+                put(key, text)
+        return text
+
+    # Concurrent identical requests share one model call
+    return flights.do(key, produce_and_store)
@@ -0,0 +1,206 @@
+# core.py
+"""Streamlit-free application core.
+
+An Application holds what one applicant entered and what was written for
+them: step inputs, generated drafts and hand edits. It is plain data, so it
+pickles into worker processes. The functions below take an Application and
+return prompts, sections and DOCX bytes. wizard.py and dashboard.py only
+copy values between it and st.session_state; batch.py builds one straight
+from a JSONL record.
+"""
+
+from generation import (
+    CONTACT_STEPS,
+    build_messages,
+    build_step_input,
+    clean_input,
+    few_shot,
+    generate_all_sections,
+    input_fingerprint,
+    section_mapping,
+    stream_all_sections,
+    wizard_steps,
+)
+import retrieval
+from markdown_ast import PLACEHOLDER
+from similar import get_index
+from textstore import pack, unpack
+
+STEPS = range(len(wizard_steps))
+
+
+def section_name(step):
+    return section_mapping.get(step, wizard_steps[step])
+
+
+def state_draft(state, step):
+    """Application.from_state(state).draft(step), unpacking only that section"""
+    edits = state.get("edited_sections") or {}
+    return (
+        unpack(edits.get(section_name(step)))
+        or unpack(state.get(f"step_{step}_generated"))
+        or ""
+    )
+
+
+class Application:
+    """Inputs, drafts and input fingerprints by step index; edits by section name"""
+
+    def __init__(self, inputs=None, generated=None, fingerprints=None, edits=None):
+        self.inputs = dict(inputs or {})
+        self.generated = dict(generated or {})
+        self.fingerprints = dict(fingerprints or {})
+        self.edits = dict(edits or {})
+
+    @classmethod
+    def from_fields(cls, fields):
+        """New application from wizard field values, e.g. a JSONL record"""
+        return cls({i: build_step_input(i, fields) for i in STEPS})
+
+    @classmethod
+    def from_state(cls, state):
+        """Copy of the application kept in a session state mapping.
+
+        Session state holds large texts as textstore handles; the copy holds
+        the texts themselves.
+        """
+        app = cls(edits=unpack(state.get("edited_sections")))
+        for i in STEPS:
+            for values, key in [
+                (app.inputs, f"step_{i}_input"),
+                (app.generated, f"step_{i}_generated"),
+                (app.fingerprints, f"step_{i}_fingerprint"),
+            ]:
+                if key in state:
+                    values[i] = unpack(state[key])
+        return app
+
+    def to_state(self, state):
+        for i, text in self.inputs.items():
+            state[f"step_{i}_input"] = pack(text)
+        for i, text in self.generated.items():
+            state[f"step_{i}_generated"] = pack(text)
+        for i, fingerprint in self.fingerprints.items():
+            state[f"step_{i}_fingerprint"] = fingerprint
+        state["edited_sections"] = pack(dict(self.edits))
+
+    def record(self, step, text):
+        """Store a new draft for step, replacing any edit of its section"""
+        self.generated[step] = text
+        self.fingerprints[step] = input_fingerprint(self.inputs.get(step, ""))
+        self.edits[section_name(step)] = text
+
+    def draft(self, step):
+        """The section's edited text, else its generated draft, else ''"""
+        return self.edits.get(section_name(step)) or self.generated.get(step) or ""
+
+    def content(self, step):
+        """Section text for export: the draft, or a placeholder"""
+        return self.draft(step) or PLACEHOLDER
+
+    def sections(self):
+        """(section_name, content) pairs in document order"""
+        return [(section_name(i), self.content(i)) for i in STEPS]
+
+    def plan(self, regenerate_all=False, overwrite_edits=False):
+        """Decide which steps need a new draft.
+
+        A step is regenerated when it has no draft yet or its input
+        fingerprint differs from the one recorded at generation time.
+        Sections edited by hand are left alone unless overwrite_edits is set.
+        Returns (to_generate, protected) lists of step indexes.
+        """
+        to_generate, protected = [], []
+        for i in STEPS:
+            generated = self.generated.get(i)
+            changed = (
+                regenerate_all
+                or generated is None
+                or self.fingerprints.get(i) != input_fingerprint(self.inputs.get(i, ""))
+            )
+            if not changed:
+                continue
+            edited = self.edits.get(section_name(i))
+            if generated is not None and edited not in (None, generated):
+                if not overwrite_edits:
+                    protected.append(i)
+                    continue
+            to_generate.append(i)
+        return to_generate, protected
+
+
+def _step_inputs(app, steps):
+    return {i: app.inputs.get(i, "") for i in (STEPS if steps is None else steps)}
+
+
+def prompts(app, steps=None):
+    """Chat messages that generating each step would send, by step index"""
+    messages = {}
+    for i, text in _step_inputs(app, steps).items():
+        text = clean_input(text)
+        messages[i] = build_messages(
+            wizard_steps[i], text, few_shot(wizard_steps[i], text)
+        )
+    return messages
+
+
+def similar_drafts(app, steps=None):
+    """Drafts written earlier for near-identical inputs, by step index.
+
+    Values are (score, earlier input, draft); steps without one, and the
+    contact step, are left out.
+    """
+    index = get_index()
+    matches = {}
+    for i, text in _step_inputs(app, steps).items():
+        if wizard_steps[i] in CONTACT_STEPS:
+            continue
+        match = index.find(wizard_steps[i], clean_input(text))
+        if match is not None:
+            matches[i] = match
+    return matches
+
+
+def generate(
+    app, steps=None, max_workers=None, refresh=False, bypass_cache=False, user=None
+):
+    """Generate drafts for steps (default all) into app; returns errors by step"""
+    results, errors = generate_all_sections(
+        _step_inputs(app, steps),
+        max_workers=max_workers,
+        refresh=refresh,
+        bypass_cache=bypass_cache,
+        user=user,
+    )
+    for i, text in results.items():
+        app.record(i, text)
+    return errors
+
+
+def stream(app, steps=None, max_workers=None, refresh=False, user=None):
+    """stream_all_sections() events for steps; finished drafts go into app"""
+    for event in stream_all_sections(
+        _step_inputs(app, steps), max_workers=max_workers, refresh=refresh, user=user
+    ):
+        if event[0] == "done":
+            app.record(event[1], event[2])
+        yield event
+
+
+def approve(app):
+    """Add the application's written sections, bar the contact step, to the
+    few-shot index"""
+    return retrieval.approve(
+        [
+            (section_name(i), app.content(i))
+            for i in STEPS
+            if wizard_steps[i] not in CONTACT_STEPS and app.content(i) != PLACEHOLDER
+        ]
+    )
+
+
+def export(app, title="ERDF Application"):
+    """DOCX bytes for the application"""
+    from docx_export import export_docx
+
+    return export_docx(app.sections(), title)
@@ -1,11 +1,28 @@
 # dashboard.py
 import streamlit as st
-from docx import Document
-from docx.shared import Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.shared import OxmlElement, qn
-from io import BytesIO
+import hashlib
+import os
 import re
+import time
+from cache import LRUCache
+import core
+import history
+from core import Application
+from generation import stream_from_ai, wizard_steps
+from export_jobs import export_key, export_status, submit_export
+from autosave import autosave_stats, save as save_draft
+
+# How often the page checks on a running DOCX export
+EXPORT_POLL_SECONDS = 0.5
+# Cleaned preview text kept per process, keyed by a hash of the raw content
+DISPLAY_CACHE_SIZE = int(os.getenv("DISPLAY_CACHE_SIZE", "256"))
+
+# Who the revision history is kept for; the same key when saving and reading
+GUEST_USER = "guest@example.com"
+
+INPUT_ECHO = re.compile(r"\*\*Your input:\*\*.*?\n\n", re.DOTALL)
+DRAFT_LABEL = re.compile(r"\*\*AI-generated draft for .*?:\*\*\n\n")
+display_cache = LRUCache(DISPLAY_CACHE_SIZE)
 
 section_titles = [
     "Full Document Preview",
@@ -23,25 +40,12 @@ def clean_content_for_display(content):
     """Clean content for display purposes only - NOT for DOCX export"""
     if not content:
         return ""
-    content = re.sub(r"\*\*Your input:\*\*.*?\n\n", "", content, flags=re.DOTALL)
-    content = re.sub(r"\*\*AI-generated draft for .*?:\*\*\n\n", "", content)
-    return content.strip()
-
-
-def get_raw_content(section_name, section_index):
-    """Get raw content without any cleaning for DOCX export"""
-    # First try to get edited content
-    content = st.session_state.edited_sections.get(section_name, "")
-
-    # If no edited content, get generated content
-    if not content:
-        content = st.session_state.get(f"step_{section_index}_generated", "")
-
-    # If still no content, return placeholder
-    if not content:
-        return "*No content provided for this section*"
-
-    return content
+    key = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    cleaned = display_cache.get(key)
+    if cleaned is None:
+        cleaned = DRAFT_LABEL.sub("", INPUT_ECHO.sub("", content)).strip()
+        display_cache.put(key, cleaned)
+    return cleaned
 
 
 def format_section_content_for_display(content):
@@ -52,286 +56,81 @@ def format_section_content_for_display(content):
     return cleaned
 
 
-# def add_paragraph_with_formatting(doc, text):
-#     """Add paragraph with proper formatting, handling bold, italic, etc."""
-#     if not text.strip():
-#         return
-
-#     # Handle different paragraph types
-#     if (
-#         text.strip().startswith("**")
-#         and text.strip().endswith("**")
-#         and text.count("**") == 2
-#     ):
-#         # Full bold paragraph
-#         p = doc.add_paragraph()
-#         run = p.add_run(text.strip()[2:-2])
-#         run.bold = True
-#         return
-
-#     # Handle numbered lists - FIXED VERSION
-#     if any(text.strip().startswith(f"{i}.") for i in range(1, 20)):
-#         # Extract the text after the number and dot
-#         match = re.match(r"^\d+\.\s*(.*)", text.strip())
-#         if match:
-#             list_text = match.group(1)
-#             p = doc.add_paragraph(list_text, style="List Number")
-#         else:
-#             # Fallback if regex fails
-#             p = doc.add_paragraph(text.strip(), style="List Number")
-#         return
-
-#     # Handle bullet points
-#     if text.strip().startswith(("*", "-")) and not text.strip().startswith("**"):
-#         # Remove the bullet and add as list item
-#         clean_text = text.strip()[1:].strip()
-#         p = doc.add_paragraph(clean_text, style="List Bullet")
-#         return
-
-#     # Regular paragraph with inline formatting
-#     paragraph = doc.add_paragraph()
-
-#     # Split text by markdown formatting
-#     parts = re.split(r"(\*\*.*?\*\*|\*.*?\*|`.*?`)", text)
-
-#     for part in parts:
-#         if not part:
-#             continue
-#         if part.startswith("**") and part.endswith("**") and len(part) > 4:
-#             # Bold text
-#             run = paragraph.add_run(part[2:-2])
-#             run.bold = True
-#         elif (
-#             part.startswith("*")
-#             and part.endswith("*")
-#             and len(part) > 2
-#             and not part.startswith("**")
-#         ):
-#             # Italic text
-#             run = paragraph.add_run(part[1:-1])
-#             run.italic = True
-#         elif part.startswith("`") and part.endswith("`"):
-#             # Code text
-#             run = paragraph.add_run(part[1:-1])
-#             run.font.name = "Courier New"
-#         else:
-#             # Regular text
-#             paragraph.add_run(part)
-
-
-def add_markdown_table_to_doc(doc, markdown_text):
-    """Convert markdown table to Word table with proper formatting"""
-    lines = [line.strip() for line in markdown_text.strip().splitlines()]
-    table_lines = [line for line in lines if "|" in line and line.strip() != ""]
-
-    if len(table_lines) < 2:
-        add_paragraph_with_formatting(doc, markdown_text)
-        return
-
-    # Find header and separator
-    header_line = table_lines[0]
-    separator_found = False
-    data_start_idx = 1
-
-    # Look for separator line (contains dashes)
-    for i, line in enumerate(table_lines[1:], 1):
-        if "-" in line and all(c in "|-: " for c in line):
-            separator_found = True
-            data_start_idx = i + 1
-            break
-
-    if not separator_found:
-        # No separator found, treat first line as header anyway
-        data_start_idx = 1
-
-    # Extract headers
-    headers = [cell.strip() for cell in header_line.strip("|").split("|")]
-    headers = [h for h in headers if h]  # Remove empty headers
-
-    if not headers:
-        add_paragraph_with_formatting(doc, markdown_text)
-        return
-
-    # Create table
-    table = doc.add_table(rows=1, cols=len(headers))
-    table.style = "Table Grid"
-    table.autofit = True
-
-    # Add headers
-    hdr_cells = table.rows[0].cells
-    for i, header in enumerate(headers):
-        if i < len(hdr_cells):
-            hdr_cells[i].text = header
-            # Make header bold
-            for paragraph in hdr_cells[i].paragraphs:
-                for run in paragraph.runs:
-                    run.bold = True
-
-    # Add data rows
-    for line in table_lines[data_start_idx:]:
-        cols = [cell.strip() for cell in line.strip("|").split("|")]
-        cols = [
-            c for c in cols if c or len(cols) == len(headers)
-        ]  # Keep empty cells if row length matches
-
-        if len(cols) != len(headers):
-            continue  # skip malformed rows
-
-        row_cells = table.add_row().cells
-        for i, cell_content in enumerate(cols):
-            if i < len(row_cells):
-                row_cells[i].text = cell_content
-
-
-def process_content_for_docx(doc, content):
-    """Process content and add to document with proper formatting"""
-    if not content or content.strip() == "*No content provided for this section*":
-        doc.add_paragraph("No content provided for this section")
-        return
-
-    # Split content into blocks (separated by double newlines)
-    blocks = content.split("\n\n")
-
-    for block in blocks:
-        block = block.strip()
-        if not block:
-            continue
-
-        # Check if this block is a table
-        lines = block.split("\n")
-        table_lines = [line for line in lines if "|" in line]
-
-        if len(table_lines) >= 2:
-            # This is likely a table block
-            add_markdown_table_to_doc(doc, block)
-        else:
-            # Regular text block - process line by line for better control
-            lines = [line.strip() for line in block.split("\n") if line.strip()]
-
-            i = 0
-            while i < len(lines):
-                line = lines[i]
-
-                # Check for headings
-                if line.startswith("###"):
-                    heading_text = line[3:].strip()
-                    doc.add_heading(heading_text, level=3)
-                    i += 1
-                elif line.startswith("##"):
-                    heading_text = line[2:].strip()
-                    doc.add_heading(heading_text, level=2)
-                    i += 1
-                elif line.startswith("#"):
-                    heading_text = line[1:].strip()
-                    doc.add_heading(heading_text, level=1)
-                    i += 1
-
-                # Check for section headings (like "2.1 - Project Concept")
-                elif re.match(r"^\d+\.\d+\s*-\s*.+", line):
-                    # This is a subsection heading
-                    heading_text = re.sub(r"^\d+\.\d+\s*-\s*", "", line)
-                    doc.add_heading(heading_text, level=2)
-                    i += 1
-
-                # Check for main section headings (like "2 - Project Idea")
-                elif re.match(r"^\d+\s*-\s*.+", line):
-                    # This is a main section heading
-                    heading_text = re.sub(r"^\d+\s*-\s*", "", line)
-                    doc.add_heading(heading_text, level=1)
-                    i += 1
-
-                # Check for numbered lists (consecutive numbered items)
-                elif re.match(r"^\d+\.\s+", line):
-                    # Look ahead to see if this is part of a numbered list
-                    j = i
-                    list_items = []
-                    while j < len(lines) and re.match(r"^\d+\.\s+", lines[j]):
-                        # Extract text after the number
-                        text_content = re.sub(r"^\d+\.\s+", "", lines[j])
-                        list_items.append(text_content)
-                        j += 1
-
-                    # Add the numbered list items
-                    for item in list_items:
-                        p = doc.add_paragraph(item, style="List Number")
-
-                    i = j  # Skip the processed lines
-
-                # Check for bullet points
-                elif line.startswith(("*", "-")) and not line.startswith("**"):
-                    # Look ahead for consecutive bullet points
-                    j = i
-                    bullet_items = []
-                    while (
-                        j < len(lines)
-                        and lines[j].startswith(("*", "-"))
-                        and not lines[j].startswith("**")
-                    ):
-                        clean_text = lines[j][1:].strip()
-                        bullet_items.append(clean_text)
-                        j += 1
-
-                    # Add the bullet list items
-                    for item in bullet_items:
-                        p = doc.add_paragraph(item, style="List Bullet")
-
-                    i = j  # Skip the processed lines
-
-                # Check for bold paragraphs
-                elif (
-                    line.startswith("**")
-                    and line.endswith("**")
-                    and line.count("**") == 2
-                ):
-                    p = doc.add_paragraph()
-                    run = p.add_run(line[2:-2])
-                    run.bold = True
-                    i += 1
-
-                # Regular paragraph
-                else:
-                    add_paragraph_with_formatting(doc, line)
-                    i += 1
-
-
-def add_paragraph_with_formatting(doc, text):
-    """Add paragraph with proper formatting, handling bold, italic, etc."""
-    if not text.strip():
-        return
-
-    # Regular paragraph with inline formatting
-    paragraph = doc.add_paragraph()
-
-    # Split text by markdown formatting
-    parts = re.split(r"(\*\*.*?\*\*|\*.*?\*|`.*?`)", text)
-
-    for part in parts:
-        if not part:
-            continue
-        if part.startswith("**") and part.endswith("**") and len(part) > 4:
-            # Bold text
-            run = paragraph.add_run(part[2:-2])
-            run.bold = True
-        elif (
-            part.startswith("*")
-            and part.endswith("*")
-            and len(part) > 2
-            and not part.startswith("**")
-        ):
-            # Italic text
-            run = paragraph.add_run(part[1:-1])
-            run.italic = True
-        elif part.startswith("`") and part.endswith("`"):
-            # Code text
-            run = paragraph.add_run(part[1:-1])
-            run.font.name = "Courier New"
-        else:
-            # Regular text
-            paragraph.add_run(part)
+def current_user():
+    return st.session_state.get("user") or GUEST_USER
+
+
+def save_edit(section, text, source="edit"):
+    app = Application.from_state(st.session_state)
+    app.edits[section] = text
+    app.to_state(st.session_state)
+    history.record(current_user(), section, text, source)
+
+
+def restore_revision(section, rev):
+    text = history.text_at(current_user(), section, rev)
+    if text is not None:
+        save_edit(section, text, "restore")
+        # The editor starts over from the restored text
+        st.session_state.pop(f"edit_{section}", None)
+
+
+def start_section_edit(section_index):
+    st.session_state[f"editing_{section_index}"] = True
+
+
+def save_section_edit(section, section_index):
+    save_edit(section, st.session_state[f"full_preview_edit_{section_index}"])
+    # Closing the editor drops the text area's copy of the section
+    st.session_state.pop(f"editing_{section_index}", None)
+    st.session_state["preview_saved"] = section
+    # Fragment reruns skip the autosave at the end of app.py
+    save_draft(st.session_state["user"], st.session_state)
+
+
+@st.fragment
+def preview_section(number, section):
+    """One section of the full preview; its edits rerun only this fragment"""
+    section_index = number - 1
+    saved = st.session_state.get("preview_saved") == section
+    if saved:
+        st.session_state.pop("preview_saved")
+        if "export_key" in st.session_state:
+            # The export on screen no longer matches; refresh the whole page
+            st.rerun()
+    content = core.state_draft(st.session_state, section_index)
+    st.markdown(f"## {number}. {section}")
+    st.markdown(format_section_content_for_display(content))
+
+    # The text area is only rendered while editing, so the session does not
+    # keep a second copy of every section
+    if st.session_state.get(f"editing_{section_index}"):
+        st.text_area(
+            f"Edit {section}",
+            value=content,
+            height=200,
+            key=f"full_preview_edit_{section_index}",
+        )
+        st.button(
+            f"💾 Save changes to {section}",
+            key=f"save_{section_index}",
+            on_click=save_section_edit,
+            args=(section, section_index),
+        )
+    else:
+        st.button(
+            f"✏️ Edit {section}",
+            key=f"edit_preview_{section_index}",
+            on_click=start_section_edit,
+            args=(section_index,),
+        )
+    if saved:
+        st.success(f"Changes to {section} saved!")
+    st.markdown("---")
 
 
 def dashboard_ui():
-    user = st.session_state.get("user", "guest@example.com")
+    user = current_user()
     st.markdown(
         f"""
         <div style="background-color: #f5f5f5; padding: 1rem; border-radius: 8px; margin-bottom: 1.5rem;">
@@ -342,103 +141,137 @@ def dashboard_ui():
         unsafe_allow_html=True,
     )
 
+    notice = st.session_state.pop("generation_notice", None)
+    if notice:
+        st.info(notice)
+
     st.sidebar.title("Navigation")
     selected_section = st.sidebar.radio("Sections", section_titles)
+    if st.sidebar.button("◀ Back to wizard"):
+        # Resubmitting only regenerates steps whose input has changed
+        st.session_state["wizard_complete"] = False
+        st.rerun()
+    st.sidebar.caption(
+        "Autosave: {writes} writes, last flush {ms:.0f} ms".format(
+            writes=autosave_stats["writes"],
+            ms=autosave_stats["last_flush_seconds"] * 1000,
+        )
+    )
 
     if selected_section == "Full Document Preview":
         st.subheader("📄 Complete Application Document")
         st.markdown("---")
 
-        with st.container():
-            for i, section in enumerate(section_titles[1:], 1):
-                st.markdown(f"## {i}. {section}")
-                content = st.session_state.edited_sections.get(
-                    section, st.session_state.get(f"step_{i-1}_generated", "")
-                )
-                st.markdown(format_section_content_for_display(content))
-                st.markdown("---")
-
-        with st.expander("✏️ Edit Sections"):
-            selected_edit = st.selectbox("Select section to edit:", section_titles[1:])
-            section_index = section_titles.index(selected_edit) - 1
-            content = st.session_state.edited_sections.get(
-                selected_edit,
-                st.session_state.get(f"step_{section_index}_generated", ""),
-            )
-            edited = st.text_area(
-                f"Edit {selected_edit}",
-                value=content,
-                height=200,
-                key=f"full_preview_edit_{section_index}",
-            )
-            if st.button(f"💾 Save changes to {selected_edit}"):
-                st.session_state.edited_sections[selected_edit] = edited
-                st.success(f"Changes to {selected_edit} saved!")
-                st.rerun()
+        for i, section in enumerate(section_titles[1:], 1):
+            preview_section(i, section)
 
         st.markdown("---")
         st.subheader("Export Options")
 
+        # Raw content, not the display-cleaned text, goes into the document
+        app = Application.from_state(st.session_state)
+        sections = app.sections()
         if st.button("⬇️ Download as DOCX"):
-            # Create document
-            doc = Document()
-
-            # Add title
-            title = doc.add_heading("ERDF Application", 0)
-            title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-            # Add a line break
-            doc.add_paragraph()
-
-            # Add each section
-            for i, section_name in enumerate(section_titles[1:]):
-                # Add section heading
-                doc.add_heading(f"{i+1}. {section_name}", level=1)
-
-                # Get raw content (without cleaning)
-                content = get_raw_content(section_name, i)
-
-                # Process and add content
-                process_content_for_docx(doc, content)
-
-                # Add space between sections
-                doc.add_paragraph()
-
-            # Save to buffer
-            buffer = BytesIO()
-            doc.save(buffer)
-            buffer.seek(0)
-
-            st.download_button(
-                "📥 Download DOCX",
-                buffer.getvalue(),
-                file_name="ERDF_Application.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            )
+            # Built in a worker process; unchanged content is served from disk
+            st.session_state["export_key"] = submit_export(sections)
+        if st.button("👍 Approve as an example for other applications"):
+            # Later drafts, for anyone, learn from approved sections
+            added = core.approve(app)
+            st.success(f"Approved: {added} new example passages.")
+        st.caption(
+            "Approving shares your reviewed sections, except the organisation "
+            "and contact details, as examples when drafts are written for "
+            "other applicants."
+        )
+
+        key = st.session_state.get("export_key")
+        if key and key != export_key(sections):
+            # Content changed since the export was requested
+            st.session_state.pop("export_key")
+            key = None
+        if key:
+            status, payload = export_status(key)
+            if status == "pending":
+                with st.spinner("Building your document..."):
+                    time.sleep(EXPORT_POLL_SECONDS)
+                st.rerun()
+            elif status == "failed":
+                st.session_state.pop("export_key")
+                st.error(f"Export failed: {payload}")
+            else:
+                st.download_button(
+                    "📥 Download DOCX",
+                    payload,
+                    file_name="ERDF_Application.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                )
         return
 
     # Single section view
     st.subheader(f"✏️ {selected_section}")
     section_index = section_titles.index(selected_section) - 1
-    content = st.session_state.edited_sections.get(
-        selected_section,
-        st.session_state.get(
-            f"step_{section_index}_generated", "No content available yet."
-        ),
-    )
+    app = Application.from_state(st.session_state)
+    content = app.draft(section_index) or "No content available yet."
+    if st.button("🔄 Regenerate with AI"):
+        # Stream the new draft in, then commit it once the model has finished
+        try:
+            ai_text = st.write_stream(
+                stream_from_ai(
+                    wizard_steps[section_index],
+                    app.inputs.get(section_index, ""),
+                    refresh=True,
+                    user=st.session_state.get("user"),
+                )
+            ).strip()
+        except Exception as e:
+            st.error(f"Could not regenerate {selected_section}: {e}")
+        else:
+            app.record(section_index, ai_text)
+            app.to_state(st.session_state)
+            history.record(user, selected_section, ai_text, "ai")
+            st.session_state[f"edit_{selected_section}"] = ai_text
+            content = ai_text
     edited_content = st.text_area(
         "Edit this section:", value=content, height=400, key=f"edit_{selected_section}"
     )
     if st.button("💾 Save Changes"):
-        st.session_state.edited_sections[selected_section] = edited_content
+        save_edit(selected_section, edited_content)
         st.success("Changes saved to your application!")
+        app = Application.from_state(st.session_state)
+
+    # Both views query or diff on every rerun, so they are opt-in
+    current = app.draft(section_index)
+    if st.toggle("Compare with the AI draft", key=f"diff_ai_{selected_section}"):
+        st.markdown(
+            history.diff_html(app.generated.get(section_index, ""), current),
+            unsafe_allow_html=True,
+        )
+    if st.toggle("🕘 Revision history", key=f"history_{selected_section}"):
+        revisions = history.list_revisions(user, selected_section)
+        if not revisions:
+            st.caption("No saved revisions yet.")
+        else:
+            chosen = st.selectbox(
+                "Revision",
+                revisions,
+                format_func=lambda r: "#{rev} · {source} · {at} · {length} characters".format(
+                    rev=r["rev"],
+                    source=r["source"],
+                    at=time.strftime("%Y-%m-%d %H:%M", time.localtime(r["at"])),
+                    length=r["length"],
+                ),
+                key=f"revision_{selected_section}",
+            )
+            text = history.text_at(user, selected_section, chosen["rev"])
+            if text is not None:
+                st.caption("Changes from this revision to the current text")
+                st.markdown(history.diff_html(text, current), unsafe_allow_html=True)
+                st.button(
+                    "↩️ Restore this revision",
+                    on_click=restore_revision,
+                    args=(selected_section, chosen["rev"]),
+                )
 
     st.divider()
     st.subheader("Your Original Input")
-    user_input = st.session_state.get(
-        f"step_{section_index}_input", "No input provided."
-    )
-    st.info(user_input)
-
-
-dashboard_ui()
+    st.info(app.inputs.get(section_index) or "No input provided.")
@@ -0,0 +1,308 @@
+# docx_export.py
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+import docx
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.shared import Emu
+from docx.table import Table
+from lxml import etree
+
+from cache import LRUCache
+from markdown_ast import parse_inline, parse_markdown, parse_table
+
+# Converted section bodies kept per process, keyed by content hash
+FRAGMENT_CACHE_SIZE = int(os.getenv("DOCX_FRAGMENT_CACHE_SIZE", "256"))
+fragment_cache = LRUCache(FRAGMENT_CACHE_SIZE)
+fragment_stats = {"hits": 0, "misses": 0}
+# Package whose styles, numbering and page setup every export reuses;
+# python-docx's default template unless DOCX_TEMPLATE points elsewhere
+DOCX_TEMPLATE = os.getenv("DOCX_TEMPLATE") or os.path.join(
+    os.path.dirname(docx.__file__), "templates", "default.docx"
+)
+DOCUMENT_PART = "word/document.xml"
+XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+
+class _StyleIds:
+    """Resolve style names to style ids once per document.
+
+    python-docx looks a style up (and scans for the default style) on every
+    styled paragraph, which dominated export time for long sections.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._ids = {}
+
+    def get(self, name, style_type=WD_STYLE_TYPE.PARAGRAPH):
+        if name not in self._ids:
+            self._ids[name] = self.doc.part.get_style_id(name, style_type)
+        return self._ids[name]
+
+    def add_paragraph(self, text, style):
+        paragraph = self.doc.add_paragraph(text)
+        paragraph._p.style = self.get(style)
+        return paragraph
+
+
+def add_runs(paragraph, runs):
+    for text, fmt in runs:
+        run = paragraph.add_run(text)
+        if fmt == "bold":
+            run.bold = True
+        elif fmt == "italic":
+            run.italic = True
+        elif fmt == "code":
+            run.font.name = "Courier New"
+
+
+def _text_xml(text):
+    # What python-docx writes for run.text; cells never hold line breaks
+    parts = []
+    for i, chunk in enumerate(text.split("\t")):
+        if i:
+            parts.append("<w:tab/>")
+        if chunk:
+            space = ' xml:space="preserve"' if chunk != chunk.strip() else ""
+            parts.append(f"<w:t{space}>{escape(chunk)}</w:t>")
+    return "".join(parts)
+
+
+def _row_xml(cells, tc_pr, paragraph_props, bold=False):
+    run_props = "<w:rPr><w:b/></w:rPr>" if bold else ""
+    return (
+        "<w:tr>"
+        + "".join(
+            f"<w:tc>{tc_pr}<w:p>{p_pr}<w:r>{run_props}{_text_xml(text)}</w:r></w:p></w:tc>"
+            for text, p_pr in zip(cells, paragraph_props)
+        )
+        + "</w:tr>"
+    )
+
+
+def add_table(doc, headers, rows, styles=None, aligns=None):
+    """Append a "Table Grid" table with a bold header row.
+
+    The whole w:tbl is built as one XML string and parsed once; adding rows
+    and setting cell text through python-docx walks the tree on every call.
+    aligns gives each column's paragraph alignment (left/center/right/None).
+    """
+    styles = styles or _StyleIds(doc)
+    style_id = styles.get("Table Grid", WD_STYLE_TYPE.TABLE)
+    # Columns share the text width evenly, as doc.add_table() does
+    width = Emu(doc._block_width // len(headers)).twips
+    tc_pr = f'<w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr>'
+    paragraph_props = [
+        f'<w:pPr><w:jc w:val="{align}"/></w:pPr>' if align else ""
+        for align in (aligns or [None] * len(headers))
+    ]
+    xml = "".join(
+        [
+            f"<w:tbl {nsdecls('w')}><w:tblPr>",
+            f'<w:tblStyle w:val="{style_id}"/><w:tblW w:type="auto" w:w="0"/>',
+            '<w:tblLayout w:type="autofit"/>',
+            '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0"'
+            ' w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>',
+            "</w:tblPr><w:tblGrid>",
+            f'<w:gridCol w:w="{width}"/>' * len(headers),
+            "</w:tblGrid>",
+            _row_xml(headers, tc_pr, paragraph_props, bold=True),
+        ]
+        + [_row_xml(cols, tc_pr, paragraph_props) for cols in rows]
+        + ["</w:tbl>"]
+    )
+    tbl = parse_xml(xml)
+    doc.element.body._insert_tbl(tbl)
+    return Table(tbl, doc._body)
+
+
+def write_nodes(doc, nodes):
+    """Append parsed markdown nodes to a python-docx document"""
+    styles = _StyleIds(doc)
+    for node in nodes:
+        kind = node[0]
+        if kind == "heading":
+            styles.add_paragraph(node[2], f"Heading {node[1]}")
+        elif kind == "list":
+            for item in node[2]:
+                styles.add_paragraph(item, node[1])
+        elif kind == "bold":
+            doc.add_paragraph().add_run(node[1]).bold = True
+        elif kind == "paragraph":
+            add_runs(doc.add_paragraph(), node[1])
+        elif kind == "table":
+            add_table(doc, node[1], node[2], styles, node[3])
+
+
+def process_content_for_docx(doc, content):
+    """Process content and add to document with proper formatting"""
+    write_nodes(doc, parse_markdown(content))
+
+
+def add_markdown_table_to_doc(doc, markdown_text):
+    """Convert markdown table to Word table with proper formatting"""
+    node = parse_table(markdown_text)
+    if node:
+        write_nodes(doc, [node])
+
+
+def add_paragraph_with_formatting(doc, text):
+    """Add paragraph with proper formatting, handling bold, italic, etc."""
+    if not text.strip():
+        return
+    add_runs(doc.add_paragraph(), parse_inline(text))
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def section_fragment(content):
+    """Serialized body XML for one section, converted at most once per content"""
+    key = content_hash(content)
+    fragment = fragment_cache.get(key)
+    if fragment is not None:
+        fragment_stats["hits"] += 1
+        return fragment
+    fragment_stats["misses"] += 1
+    scratch = Document(DOCX_TEMPLATE)
+    process_content_for_docx(scratch, content)
+    body = scratch.element.body
+    body.remove(body.sectPr)
+    fragment = etree.tostring(body)
+    fragment_cache.put(key, fragment)
+    return fragment
+
+
+def append_fragment(doc, fragment):
+    body = doc.element.body
+    sect_pr = body.sectPr
+    for child in list(parse_xml(fragment)):
+        if child.tag != qn("w:sectPr"):
+            sect_pr.addprevious(child)
+
+
+def build_document(sections, title="ERDF Application"):
+    """Assemble the application from (section_name, content) pairs.
+
+    Each section body comes from the fragment cache, so only sections whose
+    content changed since the last export are converted again.
+    """
+    doc = Document(DOCX_TEMPLATE)
+
+    # Add title
+    heading = doc.add_heading(title, 0)
+    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Add a line break
+    doc.add_paragraph()
+
+    for i, (section_name, content) in enumerate(sections):
+        doc.add_heading(f"{i+1}. {section_name}", level=1)
+        append_fragment(doc, section_fragment(content))
+        # Add space between sections
+        doc.add_paragraph()
+    return doc
+
+
+class _Template:
+    """The template package, split up once for streaming exports"""
+
+    def __init__(self, path):
+        with zipfile.ZipFile(path) as package:
+            self.parts = [(name, package.read(name)) for name in package.namelist()]
+        # Blank text dropped, as python-docx does when it loads a document
+        parser = etree.XMLParser(remove_blank_text=True)
+        root = etree.fromstring(dict(self.parts)[DOCUMENT_PART], parser)
+        body = root.find(qn("w:body"))
+        sect_pr = body.find(qn("w:sectPr"))
+        for child in list(body):
+            body.remove(child)
+        # Everything up to <w:body>, and the page setup plus closing tags
+        head, tail = etree.tostring(root).split(b"<w:body/>")
+        self.head = XML_DECLARATION + head + b"<w:body>"
+        self.tail = etree.tostring(sect_pr) + b"</w:body>" + tail
+
+        styles = _StyleIds(Document(path))
+        self.title_style = styles.get("Title")
+        self.heading_style = styles.get("Heading 1")
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_template():
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = _Template(DOCX_TEMPLATE)
+    return _template
+
+
+def _heading_xml(text, style_id, center=False):
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return (
+        f'<w:p><w:pPr><w:pStyle w:val="{style_id}"/>'
+        + ('<w:jc w:val="center"/>' if center else "")
+        + f"</w:pPr><w:r><w:t{space}>{escape(text)}</w:t></w:r></w:p>"
+    ).encode("utf-8")
+
+
+def _fragment_children(fragment):
+    # Drop the <w:body> wrapper; the document root declares the namespaces
+    if fragment.endswith(b"/>") and fragment.count(b">") == 1:
+        return b""
+    return fragment[fragment.index(b">") + 1 : fragment.rindex(b"</w:body>")]
+
+
+def write_docx(sections, out, title="ERDF Application"):
+    """Stream the application into out, a path or a writable binary file.
+
+    document.xml is written straight into the zip one section at a time from
+    the cached fragments, with every other part copied from the template, so
+    neither a python-docx tree nor a second copy of the package is held.
+    The result matches build_document().
+    """
+    template = get_template()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as package:
+        for part_name, data in template.parts:
+            if part_name != DOCUMENT_PART:
+                package.writestr(part_name, data)
+                continue
+            with package.open(DOCUMENT_PART, "w") as part:
+                part.write(template.head)
+                part.write(_heading_xml(title, template.title_style, center=True))
+                part.write(b"<w:p/>")
+                for i, (section_name, content) in enumerate(sections):
+                    part.write(
+                        _heading_xml(f"{i+1}. {section_name}", template.heading_style)
+                    )
+                    part.write(_fragment_children(section_fragment(content)))
+                    part.write(b"<w:p/>")
+                part.write(template.tail)
+
+
+def export_docx(sections, title="ERDF Application", timings=None):
+    """DOCX bytes for the application.
+
+    If timings is a dict, the seconds spent writing the package are stored
+    in it under "write".
+    """
+    started = time.perf_counter()
+    buffer = BytesIO()
+    write_docx(sections, buffer, title)
+    if timings is not None:
+        timings["write"] = time.perf_counter() - started
+    return buffer.getvalue()
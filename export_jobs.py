@@ -0,0 +1,232 @@
+# export_jobs.py
+"""DOCX export as background jobs in a process pool.
+
+Finished documents are written to an on-disk artifact store keyed by a hash
+of their content, so any session exporting unchanged content is served the
+stored file without building it again.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import observe_docx
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+ARTIFACT_DIR = os.getenv(
+    "EXPORT_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "erdf_exports")
+)
+ARTIFACT_MAX_BYTES = int(os.getenv("EXPORT_ARTIFACT_MAX_BYTES", str(256 * 1024**2)))
+ARTIFACT_TTL_SECONDS = int(os.getenv("EXPORT_ARTIFACT_TTL", str(24 * 3600)))
+
+_pool = None
+_jobs = {}
+_lock = threading.Lock()
+_pool_lock = threading.Lock()
+
+
+def export_key(sections, title="ERDF Application"):
+    payload = json.dumps([title, sections], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def artifact_path(key):
+    return os.path.join(ARTIFACT_DIR, f"{key}.docx")
+
+
+def _expired(path):
+    return time.time() - os.path.getmtime(path) > ARTIFACT_TTL_SECONDS
+
+
+def read_artifact(key):
+    """Stored bytes for key, or None when missing or expired"""
+    path = artifact_path(key)
+    try:
+        if _expired(path):
+            os.remove(path)
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    # Refresh mtime so size-based eviction drops least recently used first
+    os.utime(path)
+    return data
+
+
+def write_artifact(key, write):
+    """Store the artifact that write(f) writes to a binary file; returns its size"""
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=ARTIFACT_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            size = f.tell()
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, artifact_path(key))
+    evict_artifacts()
+    return size
+
+
+def evict_artifacts():
+    """Drop expired artifacts, then the oldest until under the size cap"""
+    now = time.time()
+    entries = []
+    for name in os.listdir(ARTIFACT_DIR):
+        if not name.endswith(".docx"):
+            continue
+        path = os.path.join(ARTIFACT_DIR, name)
+        try:
+            stat = os.stat(path)
+            if now - stat.st_mtime > ARTIFACT_TTL_SECONDS:
+                os.remove(path)
+                continue
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= ARTIFACT_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _export_job(sections, title, key):
+    # Runs in a worker process; only timings and the size travel back.
+    # The document is streamed straight into the artifact file.
+    from docx_export import write_docx
+
+    started = time.perf_counter()
+    size = write_artifact(key, lambda f: write_docx(sections, f, title))
+    return {"write": time.perf_counter() - started}, size
+
+
+def _observe_job(job):
+    if job.exception() is None:
+        observe_docx(*job.result())
+
+
+class _Job:
+    """An export and what it takes to submit it again"""
+
+    def __init__(self, key, sections, title):
+        self.key = key
+        self.sections = sections
+        self.title = title
+        self.pool = None
+        self.future = None
+        self.retried = False
+
+
+def _get_pool():
+    """The process-wide pool, started once even if sessions export together"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _start_pool()
+    return _pool
+
+
+def _start_pool():
+    # spawn: forking a threaded Streamlit server is not safe
+    pool = ProcessPoolExecutor(
+        max_workers=EXPORT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    # Spawned children re-run the parent's __main__, which under Streamlit
+    # is app.py itself. Start every worker now from a bare __main__.
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        for _ in range(EXPORT_WORKERS):
+            pool.submit(time.sleep, 0)
+    finally:
+        sys.modules["__main__"] = main
+    return pool
+
+
+def _replace_pool(broken):
+    """Drop a pool whose worker died; the next _get_pool() starts another"""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def _run(job):
+    job.pool = _get_pool()
+    try:
+        job.future = job.pool.submit(_export_job, job.sections, job.title, job.key)
+    except BrokenProcessPool as e:
+        job.future = Future()
+        job.future.set_exception(e)
+        return
+    job.future.add_done_callback(_observe_job)
+
+
+def _retry_if_broken(job):
+    """Run job once more on a new pool if a worker died (OOM kill, crash)"""
+    if job.retried or not job.future.done():
+        return
+    if not isinstance(job.future.exception(), BrokenProcessPool):
+        return
+    job.retried = True
+    _replace_pool(job.pool)
+    _run(job)
+
+
+def submit_export(sections, title="ERDF Application"):
+    """Start building the document unless it is stored or already building.
+
+    sections is a list of (section_name, content) pairs. Returns the key to
+    poll with export_status().
+    """
+    sections = [list(section) for section in sections]
+    key = export_key(sections, title)
+    try:
+        if not _expired(artifact_path(key)):
+            return key
+    except FileNotFoundError:
+        pass
+    with _lock:
+        job = _jobs.get(key)
+        if job is None or (job.future.done() and job.future.exception() is not None):
+            job = _jobs[key] = _Job(key, sections, title)
+            _run(job)
+            _retry_if_broken(job)
+    return key
+
+
+def export_status(key):
+    """("done", bytes), ("pending", None) or ("failed", message)"""
+    with _lock:
+        job = _jobs.get(key)
+        if job is not None:
+            _retry_if_broken(job)
+            job = job.future
+    if job is not None and not job.done():
+        return "pending", None
+    if job is not None and job.exception() is not None:
+        return "failed", str(job.exception())
+    data = read_artifact(key)
+    with _lock:
+        _jobs.pop(key, None)
+    if data is None:
+        return "failed", "export expired, please export again"
+    return "done", data
@@ -0,0 +1,426 @@
+# generation.py
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import retrieval
+import similar
+from metrics import OPENAI_ERRORS, OPENAI_SECONDS
+from scheduler import openai_scheduler
+from token_budget import (
+    completion_budget,
+    count_tokens,
+    record_completion,
+    record_usage,
+    trim_to_tokens,
+)
+
+# Maximum number of sections generated in parallel on "Submit All"
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+
+MODEL = "gpt-4"
+TEMPERATURE = 0.6
+MAX_TOKENS = 1000
+# Longer wizard input is trimmed to this many tokens before it is sent
+MAX_INPUT_TOKENS = int(os.getenv("GENERATION_MAX_INPUT_TOKENS", "1500"))
+
+wizard_steps = [
+    "1 - Organisation & contact",
+    "2 - Project idea",
+    "3 - Programme & geography",
+    "4 - Target group one-liner",
+    "5 - Agenda 2030 & risk",
+    "6 - Work-package generator",
+    "7 - Policies & sign-off",
+]
+# Their inputs and drafts name the applicant and their contact details, so
+# they are never shared with other applicants as drafts or examples
+CONTACT_STEPS = frozenset({wizard_steps[0]})
+
+section_mapping = {
+    0: "Project Summary",
+    1: "Challenges and Needs",
+    2: "Target Group",
+    3: "Organisation Structure",
+    4: "Risk Analysis",
+    5: "Communication Plan",
+    6: "Internal Policies",
+}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """OpenAI client, created (and the openai package imported) on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                import streamlit as st
+
+                # Retries are left to the scheduler, which shares the limits
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY") or st.secrets["OPENAI_API_KEY"],
+                    max_retries=0,
+                )
+    return _client
+
+
+# Completion cap per step; SECTION_MAX_TOKENS (JSON, by step name) overrides.
+# Budgets adapt below the cap from recent output lengths (token_budget.py).
+section_max_tokens = {step: MAX_TOKENS for step in wizard_steps}
+section_max_tokens["1 - Organisation & contact"] = 600
+section_max_tokens["7 - Policies & sign-off"] = 500
+section_max_tokens.update(json.loads(os.getenv("SECTION_MAX_TOKENS", "{}")))
+
+
+def _names(values):
+    return ", ".join(values or [])
+
+
+def build_step_input(step, values):
+    """User input text for a wizard step, from a mapping of its field values"""
+    if step == 0:
+        return (
+            f"Organisation Name: {values.get('org_name', '')}\n"
+            f"Registration Number: {values.get('reg_number', '')}\n"
+            f"Contact Name: {values.get('contact_name', '')}\n"
+            f"Email: {values.get('email', '')}\n"
+            f"Phone: {values.get('phone', '')}\n"
+            f"Subject to LOU: {values.get('lou', '')}"
+        )
+    if step == 1:
+        return values.get("project_idea", "")
+    if step == 2:
+        return (
+            f"Programme: {values.get('programme', '')}, "
+            f"Regions: {_names(values.get('region'))}"
+        )
+    if step == 3:
+        return values.get("target_group", "")
+    if step == 4:
+        return (
+            f"SDG Goals: {_names(values.get('sdg_goals'))}; "
+            f"Risks: {_names(values.get('risks'))}"
+        )
+    if step == 5:
+        return "\n".join(
+            [
+                f"{wp['name']}: {wp['description']}"
+                for wp in values.get("work_packages", [])
+            ]
+        )
+    if step == 6:
+        return f"Procurement under LOU: {values.get('procurement_lou', '')}"
+    return ""
+
+
+def build_messages(step_name, user_input, examples=()):
+    """Chat messages for one section; examples are approved snippets to imitate"""
+    prompt = (
+        f"**Your input:**\n{user_input}\n\n"
+        f"**AI-generated draft for {step_name}:**\n"
+        f"Please write professional ERDF application content for the section '{step_name}' using proper formatting, tables, and headings."
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": "You are a helpful assistant writing EU project applications.",
+        }
+    ]
+    if examples:
+        messages.append(
+            {
+                "role": "system",
+                "content": "Excerpts from approved applications for this section. "
+                "Follow their tone and structure, not their facts.\n\n"
+                + "\n\n---\n\n".join(examples),
+            }
+        )
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def few_shot(step_name, user_input):
+    """Approved snippets similar to user_input, within the section's token cap"""
+    if step_name in CONTACT_STEPS:
+        return []  # never approved, see core.approve()
+    if step_name in wizard_steps:
+        section = section_mapping.get(wizard_steps.index(step_name), step_name)
+    else:
+        section = step_name
+    return retrieval.examples(section, user_input)
+
+
+def _continue_messages(messages, partial):
+    return messages + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": "Continue exactly where you stopped."},
+    ]
+
+
+def clean_input(user_input):
+    """Input as sent to the model: normalized and trimmed to MAX_INPUT_TOKENS"""
+    # Normalized so the same answers typed on different machines share a key
+    user_input = user_input.replace("\r\n", "\n").strip()
+    return trim_to_tokens(user_input, MAX_INPUT_TOKENS, MODEL)
+
+
+def _prepare(step_name, user_input):
+    """(trimmed input, completion cap, cache key) for a generation request"""
+    user_input = clean_input(user_input)
+    cap = section_max_tokens.get(step_name, MAX_TOKENS)
+    key = cache.cache_key(step_name, user_input, MODEL, TEMPERATURE, cap)
+    return user_input, cap, key
+
+
+def _estimate_tokens(messages, max_tokens):
+    """Tokens to reserve from the per-minute budget for one request"""
+    return sum(count_tokens(m["content"], MODEL) for m in messages) + max_tokens
+
+
+def _scheduled_create(user, step_name, messages, max_tokens, started, **kwargs):
+    """Send a completion request through the shared scheduler.
+
+    started["at"] is set when the request that succeeded was sent, so the
+    measured latency leaves out queueing and retries.
+    """
+
+    def request():
+        started["at"] = time.perf_counter()
+        return get_client().chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+
+    estimate = _estimate_tokens(messages, max_tokens)
+    try:
+        return estimate, openai_scheduler.call(user or "anonymous", estimate, request)
+    except Exception as e:
+        OPENAI_ERRORS.labels(step_name, type(e).__name__).inc()
+        raise
+
+
+def _remember_draft(step_name, user_input, text):
+    """Offer text to later applicants with a near-identical input"""
+    if step_name not in CONTACT_STEPS:
+        similar.get_index().add(step_name, user_input, text)
+
+
+def generate_from_ai(
+    step_name, user_input, bypass_cache=False, refresh=False, user=None
+):
+    """Generate one section. Raises on API errors so callers can report them."""
+    user_input, cap, key = _prepare(step_name, user_input)
+
+    def call_model(messages, max_tokens):
+        started = {}
+        estimate, response = _scheduled_create(
+            user, step_name, messages, max_tokens, started
+        )
+        elapsed = time.perf_counter() - started["at"]
+        OPENAI_SECONDS.labels(step_name, "complete").observe(elapsed)
+        usage = getattr(response, "usage", None)
+        openai_scheduler.settle(estimate, getattr(usage, "total_tokens", None))
+        choice = response.choices[0]
+        truncated = choice.finish_reason == "length"
+        text = choice.message.content or ""
+        completion = record_usage(step_name, usage, elapsed, truncated, text)
+        return text, truncated, completion
+
+    def produce():
+        budget = completion_budget(step_name, cap)
+        messages = build_messages(
+            step_name, user_input, few_shot(step_name, user_input)
+        )
+        text, truncated, completion = call_model(messages, budget)
+        if truncated and budget < cap:
+            # The adapted budget was too tight; finish within the full cap
+            rest, truncated, more = call_model(
+                _continue_messages(messages, text), cap - budget
+            )
+            text += rest
+            completion += more
+        record_completion(step_name, completion, truncated)
+        if not bypass_cache:
+            _remember_draft(step_name, user_input, text.strip())
+        return text.strip()
+
+    # Joining a streamed call yields its raw text, so strip here as well
+    text = cache.cached_call(key, produce, bypass=bypass_cache, refresh=refresh)
+    return text.strip()
+
+
+def _stream_completion(user, step_name, messages, max_tokens, result):
+    """Yield deltas of one streamed call; result gets text, truncated, completion"""
+    started = {}
+    text, usage, truncated = "", None, False
+    estimate, stream = _scheduled_create(
+        user,
+        step_name,
+        messages,
+        max_tokens,
+        started,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            truncated = truncated or choice.finish_reason == "length"
+            if choice.delta.content:
+                text += choice.delta.content
+                yield choice.delta.content
+    except Exception as e:
+        OPENAI_ERRORS.labels(step_name, type(e).__name__).inc()
+        raise
+    elapsed = time.perf_counter() - started["at"]
+    OPENAI_SECONDS.labels(step_name, "stream").observe(elapsed)
+    openai_scheduler.settle(estimate, getattr(usage, "total_tokens", None))
+    result["completion"] = record_usage(step_name, usage, elapsed, truncated, text)
+    result["text"], result["truncated"] = text, truncated
+
+
+def stream_from_ai(step_name, user_input, bypass_cache=False, refresh=False, user=None):
+    """Yield the section text in chunks as the model produces it.
+
+    Identical requests already streaming in another session are joined, so
+    they share the upstream call and its chunks.
+    """
+    user_input, cap, key = _prepare(step_name, user_input)
+    text = cache.lookup(key, bypass=bypass_cache, refresh=refresh)
+    if text is not None:
+        yield text
+        return
+
+    def produce():
+        # A call for the same key may have finished since the lookup
+        text = None if bypass_cache or refresh else cache.memory_cache.get(key)
+        if text is not None:
+            yield text
+            return
+        budget = completion_budget(step_name, cap)
+        messages = build_messages(
+            step_name, user_input, few_shot(step_name, user_input)
+        )
+        first, rest = {}, {}
+        yield from _stream_completion(user, step_name, messages, budget, first)
+        text, truncated, completion = (
+            first["text"],
+            first["truncated"],
+            first["completion"],
+        )
+        if truncated and budget < cap:
+            yield from _stream_completion(
+                user,
+                step_name,
+                _continue_messages(messages, text),
+                cap - budget,
+                rest,
+            )
+            text += rest["text"]
+            truncated = rest["truncated"]
+            completion += rest["completion"]
+        record_completion(step_name, completion, truncated)
+        if not bypass_cache:
+            cache.put(key, text.strip())
+            _remember_draft(step_name, user_input, text.strip())
+
+    yield from cache.flights.stream(key, produce)
+
+
+def generate_all_sections(
+    step_inputs, max_workers=None, refresh=False, bypass_cache=False, user=None
+):
+    """Generate every section concurrently.
+
+    step_inputs maps step index -> user input. Returns (results, errors), both
+    keyed by step index; a failed section appears only in errors.
+    """
+    max_workers = max(1, max_workers or GENERATION_CONCURRENCY)
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            i: pool.submit(
+                generate_from_ai,
+                wizard_steps[i],
+                user_input,
+                bypass_cache=bypass_cache,
+                refresh=refresh,
+                user=user,
+            )
+            for i, user_input in step_inputs.items()
+        }
+        for i, future in futures.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                errors[i] = str(e)
+    return results, errors
+
+
+def stream_all_sections(step_inputs, max_workers=None, refresh=False, user=None):
+    """Stream every section concurrently.
+
+    Yields ("delta", i, text_so_far), then ("done", i, full_text) or
+    ("error", i, message) for each step index, in arrival order.
+    """
+    max_workers = max(1, max_workers or GENERATION_CONCURRENCY)
+    events = queue.Queue()
+    stop = threading.Event()
+
+    def worker(i, user_input):
+        text = ""
+        chunks = stream_from_ai(wizard_steps[i], user_input, refresh=refresh, user=user)
+        try:
+            for delta in chunks:
+                if stop.is_set():
+                    return
+                text += delta
+                events.put(("delta", i, text))
+            events.put(("done", i, text.strip()))
+        except Exception as e:
+            events.put(("error", i, str(e)))
+        finally:
+            chunks.close()
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for i, user_input in step_inputs.items():
+            pool.submit(worker, i, user_input)
+        pending = len(step_inputs)
+        while pending:
+            event = events.get()
+            # Collapse queued deltas so the UI only redraws the latest text
+            while event[0] == "delta" and not events.empty():
+                following = events.get()
+                if following[0] != "delta" or following[1] != event[1]:
+                    yield event
+                event = following
+            if event[0] != "delta":
+                pending -= 1
+            yield event
+    finally:
+        # The reader can stop early (a rerun closes the stream): don't wait
+        # for sections nobody will read, and don't start the queued ones
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def input_fingerprint(user_input):
+    return hashlib.sha256(user_input.encode("utf-8")).hexdigest()
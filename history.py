@@ -0,0 +1,248 @@
+# history.py
+"""Revision history of edited sections.
+
+Each save of a section becomes one document in erdf_auth.revisions. Most
+hold a delta against the previous revision: the character ranges replaced
+and their new text, found by diffing word tokens, so storage grows with
+the size of the edit rather than the size of the section. A revision is
+stored in full instead when the deltas since the last full text add up to
+more than the text itself, or after HISTORY_MAX_CHAIN deltas, so a full
+copy adds at most as much as the edits before it, or 1/HISTORY_MAX_CHAIN
+of the text per save when the edits are tiny.
+
+Revision r is rebuilt from the last full text at or before r, found with
+one seek on the (user, section, snapshot, rev) index, plus at most
+HISTORY_MAX_CHAIN deltas read in one range query.
+"""
+
+import html
+import os
+import re
+import threading
+import time
+from difflib import SequenceMatcher
+
+HISTORY_MAX_CHAIN = int(os.getenv("HISTORY_MAX_CHAIN", "64"))
+# Attempts when another session saves the same section at the same time
+SAVE_ATTEMPTS = 3
+
+# Words with the whitespace after them; leading whitespace on its own
+TOKEN = re.compile(r"\S+\s*|\s+")
+
+history_stats = {"saves": 0, "snapshots": 0, "stored_chars": 0, "errors": 0}
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+
+def get_revisions():
+    global _indexes_ready
+    from auth import get_db
+
+    revisions = get_db()["revisions"]
+    if not _indexes_ready:
+        with _indexes_lock:
+            if not _indexes_ready:
+                keys = [("user", 1), ("section", 1)]
+                revisions.create_index(keys + [("rev", 1)], unique=True)
+                revisions.create_index(keys + [("snapshot", 1), ("rev", -1)])
+                _indexes_ready = True
+    return revisions
+
+
+def _opcodes(a, b):
+    """SequenceMatcher opcodes for token lists, skipping the common ends"""
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < min(len(a), len(b)) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    if start:
+        yield "equal", 0, start, 0, start
+    matcher = SequenceMatcher(
+        None, a[start : len(a) - end], b[start : len(b) - end], autojunk=False
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        yield tag, i1 + start, i2 + start, j1 + start, j2 + start
+    if end:
+        yield "equal", len(a) - end, len(a), len(b) - end, len(b)
+
+
+def _offsets(tokens):
+    offsets = [0]
+    for token in tokens:
+        offsets.append(offsets[-1] + len(token))
+    return offsets
+
+
+def make_delta(old, new):
+    """[start, end, text] replacements that turn old into new"""
+    a, b = TOKEN.findall(old), TOKEN.findall(new)
+    old_at, new_at = _offsets(a), _offsets(b)
+    return [
+        [old_at[i1], old_at[i2], new[new_at[j1] : new_at[j2]]]
+        for tag, i1, i2, j1, j2 in _opcodes(a, b)
+        if tag != "equal"
+    ]
+
+
+def apply_delta(text, delta):
+    pieces, position = [], 0
+    for start, end, replacement in delta:
+        pieces += [text[position:start], replacement]
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def delta_size(delta):
+    """Rough stored size of a delta in characters"""
+    return sum(len(replacement) + 16 for _, _, replacement in delta)
+
+
+def diff(old, new):
+    """(tag, text) segments from old to new; tags are equal, delete, insert"""
+    a, b = TOKEN.findall(old), TOKEN.findall(new)
+    segments = []
+    for tag, i1, i2, j1, j2 in _opcodes(a, b):
+        if tag == "equal":
+            segments.append(("equal", "".join(a[i1:i2])))
+            continue
+        if i2 > i1:
+            segments.append(("delete", "".join(a[i1:i2])))
+        if j2 > j1:
+            segments.append(("insert", "".join(b[j1:j2])))
+    return segments
+
+
+def diff_html(old, new):
+    """diff() as HTML, deletions struck through and insertions highlighted"""
+    styles = {
+        "equal": "<span>{}</span>",
+        "delete": '<del style="background-color: #fdd;">{}</del>',
+        "insert": '<ins style="background-color: #dfd;">{}</ins>',
+    }
+    body = "".join(
+        styles[tag].format(html.escape(text)) for tag, text in diff(old, new)
+    )
+    return f'<div style="white-space: pre-wrap;">{body}</div>'
+
+
+def _rebuild(revisions, user, section, rev):
+    base = revisions.find_one(
+        {"user": user, "section": section, "snapshot": True, "rev": {"$lte": rev}},
+        sort=[("rev", -1)],
+    )
+    if base is None:
+        return None
+    text = base["text"]
+    chain = revisions.find(
+        {"user": user, "section": section, "rev": {"$gt": base["rev"], "$lte": rev}},
+        {"delta": 1},
+        sort=[("rev", 1)],
+    )
+    for doc in chain:
+        text = apply_delta(text, doc["delta"])
+    return text
+
+
+def _next_revision(revisions, user, section, text):
+    """The document storing text after the section's latest revision"""
+    latest = revisions.find_one(
+        {"user": user, "section": section},
+        {"rev": 1, "chain": 1, "chain_chars": 1},
+        sort=[("rev", -1)],
+    )
+    if latest is None:
+        return {"rev": 0, "snapshot": True, "text": text, "chain": 0, "chain_chars": 0}
+    previous = _rebuild(revisions, user, section, latest["rev"])
+    if previous == text:
+        return None
+    if previous is None:
+        # No full text to diff against (deleted or never written); start over
+        return {
+            "rev": latest["rev"] + 1,
+            "snapshot": True,
+            "text": text,
+            "chain": 0,
+            "chain_chars": 0,
+        }
+    delta = make_delta(previous, text)
+    chain_chars = latest["chain_chars"] + delta_size(delta)
+    if latest["chain"] >= HISTORY_MAX_CHAIN or chain_chars > len(text):
+        doc = {"snapshot": True, "text": text, "chain": 0, "chain_chars": 0}
+    else:
+        doc = {
+            "snapshot": False,
+            "delta": delta,
+            "chain": latest["chain"] + 1,
+            "chain_chars": chain_chars,
+        }
+    doc["rev"] = latest["rev"] + 1
+    return doc
+
+
+def record(user, section, text, source="edit"):
+    """Store text as the section's next revision.
+
+    source says where the text came from (edit, ai or restore). Returns the
+    revision number, or None if the text is unchanged or could not be stored.
+    """
+    from pymongo.errors import DuplicateKeyError, PyMongoError
+
+    try:
+        revisions = get_revisions()
+        for _ in range(SAVE_ATTEMPTS):
+            doc = _next_revision(revisions, user, section, text)
+            if doc is None:
+                return None
+            doc.update(
+                user=user,
+                section=section,
+                at=time.time(),
+                source=source,
+                length=len(text),
+            )
+            try:
+                revisions.insert_one(doc)
+            except DuplicateKeyError:
+                continue  # another session stored this revision number first
+            history_stats["saves"] += 1
+            history_stats["snapshots"] += doc["snapshot"]
+            history_stats["stored_chars"] += (
+                len(text) if doc["snapshot"] else delta_size(doc["delta"])
+            )
+            return doc["rev"]
+    except PyMongoError:
+        pass
+    history_stats["errors"] += 1
+    return None
+
+
+def list_revisions(user, section):
+    """The section's revisions, newest first, without their text"""
+    from pymongo.errors import PyMongoError
+
+    try:
+        return list(
+            get_revisions().find(
+                {"user": user, "section": section},
+                {"rev": 1, "at": 1, "source": 1, "length": 1, "snapshot": 1},
+                sort=[("rev", -1)],
+            )
+        )
+    except PyMongoError:
+        history_stats["errors"] += 1
+        return []
+
+
+def text_at(user, section, rev):
+    """The section's text at revision rev, or None"""
+    from pymongo.errors import PyMongoError
+
+    try:
+        return _rebuild(get_revisions(), user, section, rev)
+    except PyMongoError:
+        history_stats["errors"] += 1
+        return None
@@ -1,8 +1,82 @@
+import json
+
 import streamlit as st
-from auth import create_user, login_user
+from auth import (
+    SESSION_TTL_SECONDS,
+    RateLimitExceeded,
+    create_user,
+    issue_session_token,
+    login_user,
+    revoke_sessions,
+    session_user,
+)
+
+# The session token lives in a cookie, never in the URL where it would end
+# up in browser history, logs and shared links
+SESSION_COOKIE = "erdf_session"
+PENDING_COOKIE_KEY = "_session_cookie"
+LOGGED_OUT_KEY = "_logged_out"
+
+
+def _write_cookie(value, max_age):
+    # st.iframe runs HTML with same-origin access, so the script can set the
+    # cookie on the page that st.context.cookies reads on the next visit
+    cookie = f"{SESSION_COOKIE}={value}; Max-Age={max_age}; Path=/; SameSite=Strict"
+    st.iframe(
+        "<script>parent.document.cookie = "
+        f'{json.dumps(cookie)} + (parent.location.protocol === "https:" '
+        '? "; Secure" : "");</script>',
+        height=1,
+    )
+
+
+def write_session_cookie():
+    """Store the token issued at login; call once the page is rendering"""
+    value = st.session_state.pop(PENDING_COOKIE_KEY, None)
+    if value is not None:
+        _write_cookie(value, SESSION_TTL_SECONDS if value else 0)
+
+
+def restore_session():
+    """Log a returning browser back in from its session cookie"""
+    # Older links carried the token in the URL; drop it from the address bar
+    if "session" in st.query_params:
+        del st.query_params["session"]
+    if st.session_state.get(LOGGED_OUT_KEY):
+        # The browser still sends the cookie it connected with
+        return False
+    token = st.context.cookies.get(SESSION_COOKIE)
+    email = session_user(token) if token else None
+    if email:
+        st.session_state["user"] = email
+        return True
+    if token:
+        st.session_state[PENDING_COOKIE_KEY] = ""
+    return False
+
+
+def logout():
+    """Button callback: revoke the user's session tokens and forget the session"""
+    import autosave
+    from pymongo.errors import PyMongoError
+
+    user = st.session_state["user"]
+    # Queue the last changes before the session state goes
+    autosave.save(user, st.session_state)
+    try:
+        revoke_sessions(user)
+    except PyMongoError:
+        pass  # this browser is still logged out below
+    st.session_state.clear()
+    st.session_state[LOGGED_OUT_KEY] = True
+    st.session_state[PENDING_COOKIE_KEY] = ""
 
 
 def show_login():
+    if restore_session():
+        st.rerun()
+    write_session_cookie()
+
     st.title("Login to ERDF Tool")
 
     mode = st.radio("Select Mode", ["Login", "Sign Up"])
@@ -10,15 +84,20 @@ def show_login():
     password = st.text_input("Password", type="password")
 
     if st.button("Submit"):
-        if mode == "Sign Up":
-            if create_user(email, password):
-                st.success("Account created. You can now log in.")
-            else:
-                st.error("Email already registered.")
-        else:  # Login
-            if login_user(email, password):
-                st.session_state["user"] = email
-                st.success("Login successful!")
-                st.rerun()
-            else:
-                st.error("Invalid credentials.")
+        try:
+            if mode == "Sign Up":
+                if create_user(email, password):
+                    st.success("Account created. You can now log in.")
+                else:
+                    st.error("Email already registered.")
+            else:  # Login
+                if login_user(email, password):
+                    st.session_state["user"] = email
+                    st.session_state.pop(LOGGED_OUT_KEY, None)
+                    st.session_state[PENDING_COOKIE_KEY] = issue_session_token(email)
+                    st.success("Login successful!")
+                    st.rerun()
+                else:
+                    st.error("Invalid credentials.")
+        except RateLimitExceeded:
+            st.error("Too many attempts for this email. Please wait a minute.")
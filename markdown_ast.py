@@ -0,0 +1,162 @@
+# markdown_ast.py
+"""Single-pass markdown tokenizer for the DOCX export.
+
+parse_markdown() turns GPT output into a flat list of nodes, each a tuple
+whose first item is the node type:
+
+    ("heading", level, text)
+    ("list", style, items)      style is "List Number" or "List Bullet"
+    ("bold", text)              a paragraph that is bold throughout
+    ("paragraph", runs)         runs are (text, fmt), fmt in None/bold/italic/code
+    ("table", headers, rows, aligns)
+                                aligns has one of None/left/center/right per column
+"""
+
+import re
+
+PLACEHOLDER = "*No content provided for this section*"
+EMPTY_SECTION_TEXT = "No content provided for this section"
+
+# Line prefixes, in priority order: markdown headings, "2.1 - Title"
+# subsection headings, "2 - Title" section headings, numbered list items
+LINE_PREFIX = re.compile(
+    r"(?P<heading>#{1,3})"
+    r"|(?P<subsection>\d+\.\d+\s*-\s*)(?=.)"
+    r"|(?P<section>\d+\s*-\s*)(?=.)"
+    r"|(?P<numbered>\d+\.\s+)"
+)
+INLINE = re.compile(r"(\*\*.*?\*\*|\*.*?\*|`.*?`)")
+SEPARATOR_CHARS = frozenset("|-: ")
+
+
+def parse_inline(text):
+    """Split text into (text, fmt) runs for bold, italic and code spans"""
+    runs = []
+    for part in INLINE.split(text):
+        if not part:
+            continue
+        if part.startswith("**") and part.endswith("**") and len(part) > 4:
+            runs.append((part[2:-2], "bold"))
+        elif (
+            part.startswith("*")
+            and part.endswith("*")
+            and len(part) > 2
+            and not part.startswith("**")
+        ):
+            runs.append((part[1:-1], "italic"))
+        elif part.startswith("`") and part.endswith("`"):
+            runs.append((part[1:-1], "code"))
+        else:
+            runs.append((part, None))
+    return runs
+
+
+def _paragraph(text):
+    if not text.strip():
+        return None
+    return ("paragraph", parse_inline(text))
+
+
+def _split_cells(line):
+    return [cell.strip() for cell in line.strip("|").split("|")]
+
+
+def _alignment(cell):
+    if cell.startswith(":") and cell.endswith(":"):
+        return "center"
+    if cell.endswith(":"):
+        return "right"
+    if cell.startswith(":"):
+        return "left"
+    return None
+
+
+def parse_table(block):
+    """Table node for a block of pipe-delimited lines.
+
+    Lines without a pipe are dropped and rows whose cell count does not
+    match the header are skipped. Falls back to a paragraph when no header
+    can be found.
+    """
+    lines = [line.strip() for line in block.strip().splitlines()]
+    table_lines = [line for line in lines if "|" in line and line.strip() != ""]
+    if len(table_lines) < 2:
+        return _paragraph(block)
+
+    headers = [h for h in _split_cells(table_lines[0]) if h]
+    if not headers:
+        return _paragraph(block)
+
+    # Data starts after the first separator row, or straight after the header.
+    # Colons in the separator set each column's alignment.
+    data_start = 1
+    aligns = [None] * len(headers)
+    for i, line in enumerate(table_lines[1:], 1):
+        if "-" in line and SEPARATOR_CHARS.issuperset(line):
+            data_start = i + 1
+            marks = [_alignment(c) for c in _split_cells(line) if c]
+            aligns = (marks + aligns)[: len(headers)]
+            break
+
+    rows = []
+    for line in table_lines[data_start:]:
+        cols = _split_cells(line)
+        if len(cols) != len(headers):
+            cols = [c for c in cols if c]
+            if len(cols) != len(headers):
+                continue
+        rows.append(cols)
+    return ("table", headers, rows, aligns)
+
+
+def parse_markdown(content):
+    """Parse section content into a list of nodes"""
+    if not content or content.strip() == PLACEHOLDER:
+        return [("paragraph", [(EMPTY_SECTION_TEXT, None)])]
+
+    nodes = []
+    for block in content.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+
+        raw_lines = block.split("\n")
+        if sum(1 for line in raw_lines if "|" in line) >= 2:
+            node = parse_table(block)
+            if node:
+                nodes.append(node)
+            continue
+
+        for line in raw_lines:
+            line = line.strip()
+            if not line:
+                continue
+            prefix = LINE_PREFIX.match(line)
+            if prefix:
+                kind = prefix.lastgroup
+                if kind == "heading":
+                    level = len(prefix.group("heading"))
+                    nodes.append(("heading", level, line[level:].strip()))
+                elif kind == "subsection":
+                    nodes.append(("heading", 2, line[prefix.end() :]))
+                elif kind == "section":
+                    nodes.append(("heading", 1, line[prefix.end() :]))
+                else:
+                    _append_item(nodes, "List Number", line[prefix.end() :])
+            elif line[0] in "*-" and not line.startswith("**"):
+                _append_item(nodes, "List Bullet", line[1:].strip())
+            elif (
+                line.startswith("**") and line.endswith("**") and line.count("**") == 2
+            ):
+                nodes.append(("bold", line[2:-2]))
+            else:
+                nodes.append(("paragraph", parse_inline(line)))
+    return nodes
+
+
+def _append_item(nodes, style, text):
+    # Consecutive items of the same kind share one list node
+    if nodes and nodes[-1][0] == "list" and nodes[-1][1] == style:
+        nodes[-1][2].append(text)
+    else:
+        nodes.append(("list", style, [text]))
@@ -0,0 +1,284 @@
+# metrics.py
+"""Prometheus metrics for auth, generation, MongoDB and DOCX export.
+
+Latencies are histograms observed where the work happens. The counters the
+app already keeps (draft cache, bcrypt queue, autosave, token usage) are
+read from their modules only when metrics are collected, so they add no
+work on the request path.
+
+Set METRICS_PORT to serve /metrics over HTTP, or METRICS_TEXTFILE to have
+the metrics written for node_exporter's textfile collector every
+METRICS_TEXTFILE_INTERVAL seconds.
+"""
+
+import os
+import sys
+import threading
+import time
+
+from prometheus_client import REGISTRY, Counter, Histogram, start_http_server
+from prometheus_client import write_to_textfile
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+METRICS_TEXTFILE_INTERVAL = float(os.getenv("METRICS_TEXTFILE_INTERVAL", "15"))
+# A session counts as active if it ran the script this recently
+ACTIVE_SESSION_SECONDS = float(os.getenv("ACTIVE_SESSION_SECONDS", "300"))
+
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6)
+
+AUTH_SECONDS = Histogram(
+    "erdf_auth_seconds",
+    "Sign-up and login time, including bcrypt",
+    ["op"],
+    buckets=FAST_BUCKETS + (5,),
+)
+OPENAI_SECONDS = Histogram(
+    "erdf_openai_request_seconds",
+    "OpenAI chat completion time by section",
+    ["section", "mode"],
+    buckets=SLOW_BUCKETS,
+)
+OPENAI_ERRORS = Counter(
+    "erdf_openai_errors_total",
+    "Failed OpenAI requests by section and error type",
+    ["section", "error"],
+)
+OPENAI_QUEUE_SECONDS = Histogram(
+    "erdf_openai_queue_wait_seconds",
+    "Time a request waited for the shared OpenAI rate limits",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+MONGO_SECONDS = Histogram(
+    "erdf_mongo_command_seconds",
+    "MongoDB command time",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+MONGO_ERRORS = Counter(
+    "erdf_mongo_command_errors_total", "Failed MongoDB commands", ["command"]
+)
+DOCX_SECONDS = Histogram(
+    "erdf_docx_seconds",
+    "DOCX export time by stage",
+    ["stage"],
+    buckets=FAST_BUCKETS + (5, 10),
+)
+DOCX_BYTES = Histogram(
+    "erdf_docx_bytes", "Size of exported DOCX files", buckets=SIZE_BUCKETS
+)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+
+
+def session_seen(session_id):
+    with _sessions_lock:
+        _sessions[session_id] = time.monotonic()
+
+
+def active_sessions():
+    cutoff = time.monotonic() - ACTIVE_SESSION_SECONDS
+    with _sessions_lock:
+        for session_id in [s for s, seen in _sessions.items() if seen < cutoff]:
+            del _sessions[session_id]
+        return len(_sessions)
+
+
+def observe_docx(timings, size):
+    """Record an export's timings ({stage: seconds}) and size"""
+    for stage, seconds in timings.items():
+        DOCX_SECONDS.labels(stage).observe(seconds)
+    DOCX_BYTES.observe(size)
+
+
+def mongo_listener():
+    """Command listener timing everything its MongoClient sends"""
+    from pymongo import monitoring
+
+    class MongoCommandListener(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            MONGO_SECONDS.labels(event.command_name).observe(
+                event.duration_micros / 1e6
+            )
+
+        def failed(self, event):
+            MONGO_SECONDS.labels(event.command_name).observe(
+                event.duration_micros / 1e6
+            )
+            MONGO_ERRORS.labels(event.command_name).inc()
+
+    return MongoCommandListener()
+
+
+class AppStatsCollector:
+    """Exposes the stats dicts kept by the app's modules at collection time"""
+
+    def collect(self):
+        sessions = GaugeMetricFamily(
+            "erdf_active_sessions", "Sessions that ran the app recently"
+        )
+        sessions.add_metric([], active_sessions())
+        yield sessions
+
+        # Only modules this process has loaded; collecting must not import
+        cache = sys.modules.get("cache")
+        if cache is not None:
+            family = CounterMetricFamily(
+                "erdf_generation_cache",
+                "Draft cache lookups by result",
+                labels=["result"],
+            )
+            for result, count in dict(cache.stats).items():
+                family.add_metric([result], count)
+            yield family
+
+        auth = sys.modules.get("auth")
+        if auth is not None:
+            stats = dict(auth.bcrypt_stats)
+            queued = GaugeMetricFamily(
+                "erdf_bcrypt_queue_depth", "bcrypt jobs waiting for a worker"
+            )
+            queued.add_metric([], stats["queued"])
+            yield queued
+            completed = CounterMetricFamily(
+                "erdf_bcrypt_jobs", "bcrypt hashes and checks completed"
+            )
+            completed.add_metric([], stats["completed"])
+            yield completed
+
+        autosave = sys.modules.get("autosave")
+        if autosave is not None:
+            stats = dict(autosave.autosave_stats)
+            for name, key, doc in [
+                ("erdf_autosave_writes", "writes", "Draft writes to MongoDB"),
+                ("erdf_autosave_fields_written", "fields_written", "Fields written"),
+                ("erdf_autosave_errors", "errors", "Failed draft reads and writes"),
+                ("erdf_autosave_flush_seconds", "flush_seconds_total", "Write time"),
+            ]:
+                family = CounterMetricFamily(name, doc)
+                family.add_metric([], stats[key])
+                yield family
+
+        scheduler = sys.modules.get("scheduler")
+        if scheduler is not None:
+            stats = dict(scheduler.scheduler_stats)
+            depth = GaugeMetricFamily(
+                "erdf_openai_queue_depth", "Requests waiting for the rate limits"
+            )
+            depth.add_metric([], stats["queued"])
+            yield depth
+            for name, key, doc in [
+                ("erdf_openai_retries", "retries", "OpenAI requests retried"),
+                ("erdf_openai_rate_limited", "rate_limited", "429 responses"),
+            ]:
+                family = CounterMetricFamily(name, doc)
+                family.add_metric([], stats[key])
+                yield family
+
+        similar = sys.modules.get("similar")
+        if similar is not None:
+            stats = dict(similar.similar_stats)
+            for name, key, doc in [
+                ("erdf_similar_lookups", "lookups", "Near-duplicate draft lookups"),
+                ("erdf_similar_matches", "matches", "Lookups that found a draft"),
+            ]:
+                family = CounterMetricFamily(name, doc)
+                family.add_metric([], stats[key])
+                yield family
+
+        retrieval = sys.modules.get("retrieval")
+        if retrieval is not None:
+            stats = dict(retrieval.retrieval_stats)
+            for name, key, doc in [
+                ("erdf_retrieval_queries", "queries", "Few-shot index queries"),
+                ("erdf_retrieval_hits", "hits", "Queries that found snippets"),
+                ("erdf_retrieval_seconds", "seconds_total", "Query time"),
+            ]:
+                family = CounterMetricFamily(name, doc)
+                family.add_metric([], stats[key])
+                yield family
+
+        history = sys.modules.get("history")
+        if history is not None:
+            stats = dict(history.history_stats)
+            for name, key, doc in [
+                ("erdf_history_saves", "saves", "Section revisions stored"),
+                ("erdf_history_snapshots", "snapshots", "Revisions stored in full"),
+                ("erdf_history_stored_chars", "stored_chars", "Characters stored"),
+                ("erdf_history_errors", "errors", "Failed history reads and writes"),
+            ]:
+                family = CounterMetricFamily(name, doc)
+                family.add_metric([], stats[key])
+                yield family
+
+        textstore = sys.modules.get("textstore")
+        if textstore is not None:
+            report = textstore.store.report()
+            for name, key, doc in [
+                ("erdf_textstore_entries", "entries", "Distinct section texts stored"),
+                ("erdf_textstore_handles", "handles", "Session handles to them"),
+                ("erdf_textstore_bytes", "compressed_bytes", "Compressed size"),
+            ]:
+                family = GaugeMetricFamily(name, doc)
+                family.add_metric([], report[key])
+                yield family
+
+        token_budget = sys.modules.get("token_budget")
+        if token_budget is not None:
+            usage = token_budget.usage_by_section()
+            tokens = CounterMetricFamily(
+                "erdf_openai_tokens",
+                "Tokens used by section and kind",
+                labels=["section", "kind"],
+            )
+            truncated = CounterMetricFamily(
+                "erdf_openai_truncated",
+                "Completions cut off by max_tokens",
+                labels=["section"],
+            )
+            for section, entry in usage.items():
+                for kind in ("prompt", "completion"):
+                    tokens.add_metric([section, kind], entry[f"{kind}_tokens"])
+                truncated.add_metric([section], entry["truncated"])
+            yield tokens
+            yield truncated
+
+
+def _write_textfile_forever():
+    while True:
+        try:
+            write_to_textfile(METRICS_TEXTFILE, REGISTRY)
+        except OSError:
+            pass
+        time.sleep(METRICS_TEXTFILE_INTERVAL)
+
+
+def start_exporter():
+    """Register the collector and start the configured exporters, once"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        REGISTRY.register(AppStatsCollector())
+        if METRICS_PORT:
+            start_http_server(int(METRICS_PORT))
+        if METRICS_TEXTFILE:
+            threading.Thread(
+                target=_write_textfile_forever, name="metrics-textfile", daemon=True
+            ).start()
+
+
+def write_textfile():
+    """Write the textfile now, e.g. at the end of a batch run"""
+    if METRICS_TEXTFILE:
+        write_to_textfile(METRICS_TEXTFILE, REGISTRY)
@@ -0,0 +1,286 @@
+# retrieval.py
+"""On-disk BM25 index of approved sections, used as few-shot context.
+
+When applicants approve their application in the dashboard, its sections
+(all but organisation & contact) are split into snippets of about
+SNIPPET_WORDS words and added to an SQLite inverted index, partitioned by
+section name and kept owner-only in the app data directory. Before a
+draft is generated, the section's input is used as a query and the best
+RETRIEVAL_TOP_K snippets are passed to the model as examples, within a
+per-section token cap (RETRIEVAL_MAX_TOKENS, overridable per section by
+the RETRIEVAL_SECTION_TOKENS JSON mapping).
+
+Queries stay fast on large indexes because only the QUERY_TERMS rarest
+query terms are looked up, and each term's postings are stored ordered by
+their BM25 term weight, so only the best POSTINGS_PER_TERM are read. The
+scores of the snippets returned are exact; a snippet can only be missed if
+none of its query terms is among its term's heaviest postings.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from appdata import data_path, make_private_dir, restrict
+from token_budget import count_tokens, trim_to_tokens
+
+RETRIEVAL_INDEX_PATH = os.getenv("RETRIEVAL_INDEX_PATH", data_path("retrieval.sqlite3"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "2"))
+RETRIEVAL_MAX_TOKENS = int(os.getenv("RETRIEVAL_MAX_TOKENS", "300"))
+section_max_tokens = json.loads(os.getenv("RETRIEVAL_SECTION_TOKENS", "{}"))
+SNIPPET_WORDS = 120
+QUERY_TERMS = 12
+POSTINGS_PER_TERM = 256
+# SQLite page cache per connection
+CACHE_KIB = int(os.getenv("RETRIEVAL_CACHE_KIB", str(64 * 1024)))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TERM = re.compile(r"[^\W_]{2,}")
+STOPWORDS = frozenset(
+    """a an and are as at be by for from has have in into is it its of on or
+    our that the their this to was we were will with which who you your
+    all also any can each more other such than these they those through
+    under within""".split()
+)
+
+retrieval_stats = {"queries": 0, "hits": 0, "seconds_total": 0.0, "snippets": 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snippets (
+    id INTEGER PRIMARY KEY,
+    section TEXT NOT NULL,
+    digest TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    section TEXT NOT NULL,
+    term TEXT NOT NULL,
+    weight REAL NOT NULL,
+    snippet INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (section, term, weight DESC, snippet)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    section TEXT NOT NULL,
+    term TEXT NOT NULL,
+    df INTEGER NOT NULL,
+    PRIMARY KEY (section, term)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS partitions (
+    section TEXT PRIMARY KEY,
+    snippets INTEGER NOT NULL,
+    total_length INTEGER NOT NULL
+);
+"""
+
+
+def terms(text):
+    return [t for t in TERM.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _term_weight(tf, length, avg_length):
+    """BM25 term frequency component"""
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+    return tf * (BM25_K1 + 1) / (tf + norm)
+
+
+def split_snippets(content, words=SNIPPET_WORDS):
+    """Paragraph-aligned chunks of content, each about words long"""
+    snippets, current, size = [], [], 0
+    for paragraph in content.replace("\r\n", "\n").split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        count = len(paragraph.split())
+        if current and size + count > words:
+            snippets.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += count
+    if current:
+        snippets.append("\n\n".join(current))
+    return snippets
+
+
+class RetrievalIndex:
+    def __init__(self, path):
+        # Created owner-only; SQLite gives its -wal and -shm files the same mode
+        make_private_dir(path)
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        restrict(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA cache_size=-{CACHE_KIB}")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add(self, sections):
+        """Index (section, content) pairs in one transaction; returns new snippets"""
+        added = 0
+        with self._lock, self._conn:
+            for section, content in sections:
+                for snippet in split_snippets(content):
+                    added += self._add_snippet(section, snippet)
+            retrieval_stats["snippets"] += added
+        return added
+
+    def _add_snippet(self, section, snippet):
+        counts = Counter(terms(snippet))
+        if not counts:
+            return 0
+        digest = hashlib.sha256(f"{section}\0{snippet}".encode("utf-8")).hexdigest()
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO snippets (section, digest, text) VALUES (?, ?, ?)",
+            (section, digest, snippet),
+        )
+        if not cursor.rowcount:
+            return 0  # approved before
+        snippet_id, length = cursor.lastrowid, sum(counts.values())
+        row = self._conn.execute(
+            "INSERT INTO partitions VALUES (?, 1, ?) ON CONFLICT (section) "
+            "DO UPDATE SET snippets = snippets + 1, "
+            "total_length = total_length + excluded.total_length "
+            "RETURNING snippets, total_length",
+            (section, length),
+        ).fetchone()
+        # Ordering key only; queries rescore with the current average length
+        avg_length = row[1] / row[0]
+        self._conn.executemany(
+            "INSERT INTO postings VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    section,
+                    t,
+                    _term_weight(tf, length, avg_length),
+                    snippet_id,
+                    tf,
+                    length,
+                )
+                for t, tf in counts.items()
+            ],
+        )
+        self._conn.executemany(
+            "INSERT INTO terms VALUES (?, ?, 1) "
+            "ON CONFLICT (section, term) DO UPDATE SET df = df + 1",
+            [(section, t) for t in counts],
+        )
+        return 1
+
+    def search(self, section, query, k=RETRIEVAL_TOP_K):
+        """Up to k (score, snippet) pairs from section, best first"""
+        started = time.perf_counter()
+        with self._lock:
+            results = self._search(section, query, k) if k > 0 else []
+            retrieval_stats["queries"] += 1
+            retrieval_stats["hits"] += bool(results)
+            retrieval_stats["seconds_total"] += time.perf_counter() - started
+        return results
+
+    def _search(self, section, query, k):
+        query_terms = list(set(terms(query)))
+        if not query_terms:
+            return []
+        row = self._conn.execute(
+            "SELECT snippets, total_length FROM partitions WHERE section = ?",
+            (section,),
+        ).fetchone()
+        if row is None:
+            return []
+        n, total_length = row
+        avg_length = total_length / n
+        marks = ",".join("?" * len(query_terms))
+        df = dict(
+            self._conn.execute(
+                f"SELECT term, df FROM terms WHERE section = ? AND term IN ({marks})",
+                [section, *query_terms],
+            )
+        )
+        idf = {t: math.log((n - d + 0.5) / (d + 0.5) + 1) for t, d in df.items()}
+        chosen = heapq.nlargest(QUERY_TERMS, idf, key=idf.get)
+        if not chosen:
+            return []
+        # BM25 summed inside SQLite over each term's heaviest postings
+        arm = (
+            "SELECT * FROM (SELECT snippet, ? * tf / (tf + ? + ? * length) AS score "
+            "FROM postings WHERE section = ? AND term = ? "
+            "ORDER BY weight DESC LIMIT ?)"
+        )
+        params = []
+        for term in chosen:
+            params += [
+                idf[term] * (BM25_K1 + 1),
+                BM25_K1 * (1 - BM25_B),
+                BM25_K1 * BM25_B / avg_length,
+                section,
+                term,
+                POSTINGS_PER_TERM,
+            ]
+        rows = self._conn.execute(
+            "SELECT best.total, s.text FROM (SELECT snippet, SUM(score) AS total FROM ("
+            + " UNION ALL ".join([arm] * len(chosen))
+            + ") GROUP BY snippet ORDER BY total DESC LIMIT ?) AS best "
+            "JOIN snippets AS s ON s.id = best.snippet ORDER BY best.total DESC",
+            params + [k],
+        ).fetchall()
+        return [(score, text) for score, text in rows]
+
+    def count(self, section=None):
+        with self._lock:
+            if section is None:
+                row = self._conn.execute(
+                    "SELECT COALESCE(SUM(snippets), 0) FROM partitions"
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT snippets FROM partitions WHERE section = ?", (section,)
+                ).fetchone()
+        return row[0] if row else 0
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index, opened on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = RetrievalIndex(RETRIEVAL_INDEX_PATH)
+    return _index
+
+
+def approve(sections):
+    """Add approved (section_name, content) pairs to the index"""
+    return get_index().add(sections)
+
+
+def examples(section, query):
+    """Snippets for a section's prompt, together within its token cap"""
+    cap = section_max_tokens.get(section, RETRIEVAL_MAX_TOKENS)
+    if cap <= 0 or RETRIEVAL_TOP_K <= 0:
+        return []
+    try:
+        found = get_index().search(section, query)
+    except sqlite3.Error:
+        # Drafts are still written without examples
+        return []
+    chosen, left = [], cap
+    for _, snippet in found:
+        if left <= 0:
+            break
+        snippet = trim_to_tokens(snippet, left)
+        chosen.append(snippet)
+        left -= count_tokens(snippet)
+    return chosen
@@ -0,0 +1,202 @@
+# scheduler.py
+"""Process-wide scheduler for OpenAI calls.
+
+Every call waits for a slot from two token buckets, one for requests per
+minute and one for tokens per minute. Waiting calls are queued per user and
+granted round-robin, so one user submitting many sections cannot starve
+the others. Rate-limit and transient errors are retried with exponential
+backoff and full jitter, honouring Retry-After when the API sends it; a
+429 also pauses every queued call, since the limit is shared.
+"""
+
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from metrics import OPENAI_QUEUE_SECONDS
+
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+scheduler_stats = {
+    "queued": 0,
+    "max_queued": 0,
+    "granted": 0,
+    "wait_seconds_total": 0.0,
+    "last_wait_seconds": 0.0,
+    "retries": 0,
+    "rate_limited": 0,
+}
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 per second, holding at most per_minute.
+
+    Not locked; the scheduler only touches it under its own lock.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until amount can be taken"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = threading.Event()
+
+
+class Scheduler:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # user -> waiting tickets; the first user is served next
+        self._queues = OrderedDict()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+    def acquire(self, user, tokens):
+        """Block until this user may send a request estimated at tokens"""
+        ticket = _Ticket(tokens)
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(ticket)
+            scheduler_stats["queued"] += 1
+            scheduler_stats["max_queued"] = max(
+                scheduler_stats["max_queued"], scheduler_stats["queued"]
+            )
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch, name="openai-scheduler", daemon=True
+                )
+                self._dispatcher.start()
+            self._cond.notify()
+        ticket.granted.wait()
+        waited = time.monotonic() - ticket.enqueued
+        OPENAI_QUEUE_SECONDS.observe(waited)
+        with self._cond:
+            scheduler_stats["wait_seconds_total"] += waited
+            scheduler_stats["last_wait_seconds"] = waited
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                user, tickets = next(iter(self._queues.items()))
+                ticket = tickets[0]
+                now = time.monotonic()
+                delay = max(
+                    self._paused_until - now,
+                    self.requests.delay(1, now),
+                    self.tokens.delay(ticket.tokens, now),
+                )
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                self.requests.take(1)
+                self.tokens.take(ticket.tokens)
+                tickets.popleft()
+                # Round-robin: this user goes to the back of the line
+                del self._queues[user]
+                if tickets:
+                    self._queues[user] = tickets
+                scheduler_stats["queued"] -= 1
+                scheduler_stats["granted"] += 1
+            ticket.granted.set()
+
+    def settle(self, estimated, actual):
+        """Return tokens reserved beyond what a finished call used"""
+        if actual is None or actual >= estimated:
+            return
+        with self._cond:
+            self.tokens.give_back(estimated - actual)
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def call(self, user, tokens, fn):
+        """fn() once a slot is granted, retrying transient API errors"""
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            self.acquire(user, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                # A failed request used none of the tokens reserved for it
+                self.settle(tokens, 0)
+                status = _status(e)
+                if attempt == OPENAI_MAX_RETRIES or not _retryable(e, status):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(
+                        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+                    )
+                with self._cond:
+                    scheduler_stats["retries"] += 1
+                    if status == 429:
+                        scheduler_stats["rate_limited"] += 1
+                if status == 429:
+                    self.pause(delay)
+                else:
+                    time.sleep(delay)
+
+
+def _status(error):
+    return getattr(error, "status_code", None)
+
+
+def _retryable(error, status):
+    from openai import APIConnectionError
+
+    # APITimeoutError is a subclass of APIConnectionError
+    return status in RETRY_STATUS or isinstance(error, APIConnectionError)
+
+
+def _retry_after(error):
+    """Seconds the API asked us to wait, if it said"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+openai_scheduler = Scheduler(OPENAI_RPM, OPENAI_TPM)
@@ -0,0 +1,211 @@
+# similar.py
+"""Near-duplicate index of past drafts.
+
+Inputs that differ only in names, punctuation or whitespace miss the exact
+draft cache. Here each (step_name, user_input) -> draft pair is reduced to a
+MinHash signature over word 3-shingles, and locality-sensitive hashing
+(SIMILAR_BANDS bands of rows) finds earlier inputs that share a band. The
+best candidate whose estimated Jaccard similarity reaches SIMILAR_THRESHOLD
+is offered as a starting draft.
+
+The index holds at most SIMILAR_MAX_ENTRIES drafts, dropping the least
+recently added, and is appended to SIMILAR_INDEX_PATH so it survives
+restarts; the file is rewritten once it holds twice as many lines. It
+holds applicants' inputs, so it is kept in the app data directory and is
+readable by the app's user only.
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+from appdata import data_path, make_private_dir, restrict
+
+SIMILAR_INDEX_PATH = os.getenv("SIMILAR_INDEX_PATH", data_path("similar.jsonl"))
+SIMILAR_MAX_ENTRIES = int(os.getenv("SIMILAR_MAX_ENTRIES", "2000"))
+SIMILAR_THRESHOLD = float(os.getenv("SIMILAR_THRESHOLD", "0.7"))
+# 16 bands of 4 rows: pairs above ~0.5 similarity usually share a band
+SIMILAR_BANDS = int(os.getenv("SIMILAR_BANDS", "16"))
+SIMILAR_ROWS = int(os.getenv("SIMILAR_ROWS", "4"))
+SHINGLE_WORDS = 3
+
+_PRIME = (1 << 61) - 1
+WORD = re.compile(r"\w+")
+
+similar_stats = {"lookups": 0, "matches": 0, "added": 0, "evicted": 0}
+
+
+def shingles(text):
+    """Word 3-grams of text, case and punctuation ignored"""
+    words = WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def _hash(shingle):
+    digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class MinHash:
+    """Signatures of num_perm universal hash permutations, stable across runs"""
+
+    def __init__(self, num_perm, seed=1):
+        rng = random.Random(seed)
+        self.params = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, text):
+        hashes = [_hash(s) for s in shingles(text)] or [0]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self.params]
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+class DraftIndex:
+    def __init__(self, path, max_entries, bands, rows):
+        self.path = path
+        self.max_entries = max_entries
+        self.bands = bands
+        self.rows = rows
+        self.minhash = MinHash(bands * rows)
+        # id -> (step_name, user_input, signature, text), oldest first
+        self._entries = OrderedDict()
+        # (step_name, band, band values) -> ids
+        self._buckets = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _bands(self, step_name, signature):
+        for band in range(self.bands):
+            values = tuple(signature[band * self.rows : (band + 1) * self.rows])
+            yield step_name, band, values
+
+    def _insert(self, entry_id, entry):
+        if entry_id in self._entries:
+            self._remove(entry_id)
+        self._entries[entry_id] = entry
+        for bucket in self._bands(entry[0], entry[2]):
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            similar_stats["evicted"] += 1
+
+    def _remove(self, entry_id):
+        step_name, _, signature, _ = self._entries.pop(entry_id)
+        for bucket in self._bands(step_name, signature):
+            ids = self._buckets.get(bucket)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[bucket]
+
+    def _load(self):
+        restrict(self.path)  # written by a version that left it world-readable
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        step_name, user_input, signature, text = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    if len(signature) != len(self.minhash.params):
+                        signature = self.minhash.signature(user_input)
+                    self._insert(
+                        _entry_id(step_name, user_input),
+                        (step_name, user_input, signature, text),
+                    )
+        except FileNotFoundError:
+            pass
+
+    def _compact(self):
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._lines = len(self._entries)
+
+    def add(self, step_name, user_input, text):
+        """Remember the draft written for user_input"""
+        if not user_input.strip() or not text.strip():
+            return
+        signature = self.minhash.signature(user_input)
+        entry = (step_name, user_input, signature, text)
+        with self._lock:
+            self._insert(_entry_id(step_name, user_input), entry)
+            similar_stats["added"] += 1
+            try:
+                make_private_dir(self.path)
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                with open(fd, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._lines += 1
+                if self._lines > 2 * self.max_entries:
+                    self._compact()
+            except OSError:
+                pass  # the in-memory index still works
+
+    def find(self, step_name, user_input, threshold=None):
+        """(score, earlier input, draft) of the most similar other input, or None"""
+        threshold = SIMILAR_THRESHOLD if threshold is None else threshold
+        if not user_input.strip():
+            return None
+        signature = self.minhash.signature(user_input)
+        best = None
+        with self._lock:
+            similar_stats["lookups"] += 1
+            candidates = set()
+            for bucket in self._bands(step_name, signature):
+                candidates |= self._buckets.get(bucket, set())
+            for entry_id in candidates:
+                _, earlier, other, text = self._entries[entry_id]
+                if earlier == user_input:
+                    continue  # the exact draft cache covers this
+                score = similarity(signature, other)
+                if score >= threshold and (best is None or score > best[0]):
+                    best = (score, earlier, text)
+            if best is not None:
+                similar_stats["matches"] += 1
+        return best
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _entry_id(step_name, user_input):
+    payload = json.dumps([step_name, user_input], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index, loaded from disk on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DraftIndex(
+                    SIMILAR_INDEX_PATH, SIMILAR_MAX_ENTRIES, SIMILAR_BANDS, SIMILAR_ROWS
+                )
+    return _index
@@ -0,0 +1,144 @@
+# textstore.py
+"""Compressed, content-addressed storage for large section text.
+
+Session state keeps a small TextHandle in place of any string of at least
+TEXT_OFFLOAD_MIN_CHARS characters. The text itself is stored once per
+process, zlib-compressed and keyed by its SHA-256, so sessions holding the
+same draft share it. Recently read texts are kept decompressed in an LRU of
+TEXT_HOT_ENTRIES. A stored text is dropped when the last handle to it is
+garbage collected.
+
+pack() and unpack() convert values (strings, or dicts of them such as
+edited_sections) on their way into and out of session state.
+"""
+
+import hashlib
+import os
+import threading
+import weakref
+import zlib
+from collections import deque
+
+from cache import LRUCache
+
+TEXT_OFFLOAD_MIN_CHARS = int(os.getenv("TEXT_OFFLOAD_MIN_CHARS", "512"))
+TEXT_HOT_ENTRIES = int(os.getenv("TEXT_HOT_ENTRIES", "128"))
+COMPRESS_LEVEL = 6
+
+
+class TextHandle:
+    """Stands in for a stored text; equal handles refer to the same text"""
+
+    __slots__ = ("key", "length", "__weakref__")
+
+    def __init__(self, key, length):
+        self.key = key
+        self.length = length
+
+    def __eq__(self, other):
+        return isinstance(other, TextHandle) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    # Immutable: copies share the handle, pickles carry the text itself
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return pack, (unpack(self),)
+
+    def __str__(self):
+        return unpack(self)
+
+    def __repr__(self):
+        return f"<TextHandle {self.key[:12]} {self.length} chars>"
+
+
+class TextStore:
+    def __init__(self, hot_entries):
+        # key -> [compressed text, live handles]
+        self._blobs = {}
+        self._hot = LRUCache(hot_entries)
+        self._lock = threading.Lock()
+        # Keys of collected handles, not yet subtracted from _blobs
+        self._released = deque()
+
+    def put(self, text):
+        """Handle for text, storing it unless it is stored already"""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            # Settle releases first, so a blob just dropped is stored anew
+            self._drain()
+            entry = self._blobs.get(key)
+            if entry is None:
+                data = zlib.compress(text.encode("utf-8"), COMPRESS_LEVEL)
+                self._blobs[key] = [data, 1]
+            else:
+                entry[1] += 1
+        handle = TextHandle(key, len(text))
+        weakref.finalize(handle, self._release, key)
+        self._hot.put(key, text)
+        return handle
+
+    def get(self, handle):
+        text = self._hot.get(handle.key)
+        if text is None:
+            with self._lock:
+                data = self._blobs[handle.key][0]
+            text = zlib.decompress(data).decode("utf-8")
+            self._hot.put(handle.key, text)
+        return text
+
+    def _release(self, key):
+        # Finalizer: runs during garbage collection, possibly in a thread
+        # that holds _lock, so it must not take it
+        self._released.append(key)
+
+    def _drain(self):
+        """Apply queued releases; call with _lock held"""
+        while self._released:
+            key = self._released.popleft()
+            entry = self._blobs.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._blobs[key]
+
+    def report(self):
+        """Entries, live handles and stored/original bytes"""
+        with self._lock:
+            self._drain()
+            blobs = list(self._blobs.values())
+        return {
+            "entries": len(blobs),
+            "handles": sum(refs for _, refs in blobs),
+            "compressed_bytes": sum(len(data) for data, _ in blobs),
+            "hot_entries": len(self._hot),
+        }
+
+
+store = TextStore(TEXT_HOT_ENTRIES)
+
+
+def pack(value):
+    """value with large strings, also inside a dict, replaced by handles"""
+    if isinstance(value, str):
+        if len(value) >= TEXT_OFFLOAD_MIN_CHARS:
+            return store.put(value)
+        return value
+    if isinstance(value, dict):
+        return {key: pack(item) for key, item in value.items()}
+    return value
+
+
+def unpack(value):
+    """value with handles, also inside a dict, replaced by their text"""
+    if isinstance(value, TextHandle):
+        return store.get(value)
+    if isinstance(value, dict):
+        return {key: unpack(item) for key, item in value.items()}
+    return value
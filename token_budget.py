@@ -0,0 +1,147 @@
+# token_budget.py
+"""Token counting, adaptive completion budgets and usage accounting.
+
+Each section's completion budget starts at its configured cap and, once
+enough calls have been seen, shrinks to the recent 95th percentile of its
+output length plus headroom. A truncated completion puts the section back
+on its full cap. tiktoken is used for local estimates when installed;
+otherwise text is counted at roughly four characters per token.
+
+tiktoken downloads a model's encoding file the first time it is used,
+into TIKTOKEN_CACHE_DIR when that is set. Fetch it at deploy time with
+
+    python token_budget.py
+
+so the first request after startup does not wait on the network.
+"""
+
+import math
+import os
+import threading
+from collections import deque
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Recent completions kept per section, and how many before budgets adapt
+BUDGET_HISTORY = int(os.getenv("TOKEN_BUDGET_HISTORY", "50"))
+BUDGET_MIN_SAMPLES = int(os.getenv("TOKEN_BUDGET_MIN_SAMPLES", "5"))
+# Budget = p95 of recent completions times this, never below MIN_BUDGET
+BUDGET_HEADROOM = float(os.getenv("TOKEN_BUDGET_HEADROOM", "1.3"))
+MIN_BUDGET = int(os.getenv("TOKEN_BUDGET_MIN", "128"))
+CHARS_PER_TOKEN = 4
+
+# Per section: calls, prompt/completion/total tokens, seconds, truncated
+usage_stats = {}
+_lock = threading.Lock()
+_history = {}
+_encodings = {}
+
+
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            # Unknown model or the encoding files cannot be fetched
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4"):
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def trim_to_tokens(text, max_tokens, model="gpt-4"):
+    """text cut down to about max_tokens, marked with an ellipsis if cut"""
+    encoding = _encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]).rstrip() + " …"
+    if len(text) <= max_tokens * CHARS_PER_TOKEN:
+        return text
+    return text[: max_tokens * CHARS_PER_TOKEN].rstrip() + " …"
+
+
+def completion_budget(section, cap):
+    """max_tokens to request for section, never above cap"""
+    with _lock:
+        samples = list(_history.get(section, ()))
+    if len(samples) < BUDGET_MIN_SAMPLES:
+        return cap
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+    if p95 == math.inf:
+        return cap
+    return max(MIN_BUDGET, min(cap, math.ceil(p95 * BUDGET_HEADROOM)))
+
+
+def record_usage(section, usage, seconds, truncated, completion_text=""):
+    """Account one call; usage is the response's usage object, if any.
+
+    Returns the call's completion tokens. The completion budget is fed
+    separately, one record_completion() per answer, because an answer may
+    span a call and its continuation.
+    """
+    if usage is not None:
+        prompt = usage.prompt_tokens or 0
+        completion = usage.completion_tokens or 0
+    else:
+        prompt, completion = 0, count_tokens(completion_text)
+    with _lock:
+        entry = usage_stats.setdefault(
+            section,
+            {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "seconds": 0.0,
+                "truncated": 0,
+            },
+        )
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt
+        entry["completion_tokens"] += completion
+        entry["total_tokens"] += prompt + completion
+        entry["seconds"] += seconds
+        entry["truncated"] += bool(truncated)
+    return completion
+
+
+def record_completion(section, completion, truncated):
+    """Add one answer's total completion tokens to the section's history"""
+    with _lock:
+        history = _history.setdefault(section, deque(maxlen=BUDGET_HISTORY))
+        # A cut-off answer says nothing about the length it wanted
+        history.append(math.inf if truncated else completion)
+
+
+def usage_by_section():
+    with _lock:
+        return {section: dict(entry) for section, entry in usage_stats.items()}
+
+
+def usage_totals():
+    with _lock:
+        return {
+            key: sum(entry[key] for entry in usage_stats.values())
+            for key in ("calls", "prompt_tokens", "completion_tokens", "total_tokens")
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    if _encoding("gpt-4") is None:
+        sys.exit("tiktoken is not installed or the gpt-4 encoding could not be fetched")
+    print("gpt-4 encoding ready")
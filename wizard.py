@@ -1,57 +1,12 @@
 # wizard.py
 import streamlit as st
-import os
-import time
-from io import BytesIO
-from docx import Document
-from openai import OpenAI
-from streamlit_extras.switch_page_button import switch_page
-
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-wizard_steps = [
-    "1 - Organisation & contact",
-    "2 - Project idea",
-    "3 - Programme & geography",
-    "4 - Target group one-liner",
-    "5 - Agenda 2030 & risk",
-    "6 - Work-package generator",
-    "7 - Policies & sign-off",
-]
-
-section_mapping = {
-    0: "Project Summary",
-    1: "Challenges and Needs",
-    2: "Target Group",
-    3: "Organisation Structure",
-    4: "Risk Analysis",
-    5: "Communication Plan",
-    6: "Internal Policies",
-}
-
-
-def generate_from_ai(step_name, user_input):
-    prompt = (
-        f"**Your input:**\n{user_input}\n\n"
-        f"**AI-generated draft for {step_name}:**\n"
-        f"Please write professional ERDF application content for the section '{step_name}' using proper formatting, tables, and headings."
-    )
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant writing EU project applications.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.6,
-            max_tokens=1000,
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"❌ Error: {e}"
+import cache
+import core
+from core import Application, section_name
+from generation import build_step_input, wizard_steps
+from scheduler import scheduler_stats
+from textstore import pack
+from token_budget import usage_totals
 
 
 def wizard_ui():
@@ -77,7 +32,6 @@ def wizard_ui():
     st.subheader(f"Step {step+1}/{len(wizard_steps)}: {step_label}")
     st.divider()
 
-    user_input = ""
     if step == 0:
         col1, col2 = st.columns(2)
         with col1:
@@ -89,22 +43,12 @@ def wizard_ui():
             st.text_input("Phone", key="phone")
         st.radio("Subject to LOU", ["Yes", "No"], key="lou")
 
-        user_input = (
-            f"Organisation Name: {st.session_state.org_name}\n"
-            f"Registration Number: {st.session_state.reg_number}\n"
-            f"Contact Name: {st.session_state.contact_name}\n"
-            f"Email: {st.session_state.email}\n"
-            f"Phone: {st.session_state.phone}\n"
-            f"Subject to LOU: {st.session_state.lou}"
-        )
-
     elif step == 1:
         st.text_area(
             "Short project idea (max 1,000 characters)",
             key="project_idea",
             max_chars=1000,
         )
-        user_input = st.session_state.get("project_idea", "")
 
     elif step == 2:
         st.selectbox(
@@ -115,11 +59,9 @@ def wizard_ui():
             ["Region North", "Region South", "Region East", "Region West"],
             key="region",
         )
-        user_input = f"Programme: {st.session_state.programme}, Regions: {', '.join(st.session_state.region)}"
 
     elif step == 3:
         st.text_area("Target group description", key="target_group", max_chars=500)
-        user_input = st.session_state.get("target_group", "")
 
     elif step == 4:
         st.multiselect(
@@ -130,7 +72,6 @@ def wizard_ui():
             ["Low participation", "Budget overrun", "Tech delays", "Staff turnover"],
             key="risks",
         )
-        user_input = f"SDG Goals: {', '.join(st.session_state.sdg_goals)}; Risks: {', '.join(st.session_state.risks)}"
 
     elif step == 5:
         if "work_packages" not in st.session_state:
@@ -141,19 +82,58 @@ def wizard_ui():
                 st.session_state.work_packages.append(
                     {"name": wp, "description": f"Placeholder for {wp}"}
                 )
-        user_input = "\n".join(
-            [
-                f"{wp['name']}: {wp['description']}"
-                for wp in st.session_state.work_packages
-            ]
-        )
 
     elif step == 6:
         st.radio("Procurement according to LOU", ["Yes", "No"], key="procurement_lou")
-        user_input = f"Procurement under LOU: {st.session_state.procurement_lou}"
 
-    st.session_state[step_input_key] = user_input
+    st.session_state[step_input_key] = pack(build_step_input(step, st.session_state))
 
+    similar = {}
+    if step == len(wizard_steps) - 1:
+        st.checkbox(
+            "Stream drafts as they are written", value=True, key="stream_generation"
+        )
+        st.checkbox(
+            "Ignore cached drafts and regenerate from scratch", key="refresh_cache"
+        )
+        st.checkbox(
+            "Regenerate sections whose input has not changed", key="regenerate_all"
+        )
+        st.checkbox("Overwrite sections I have edited by hand", key="overwrite_edits")
+        if not st.session_state.get("refresh_cache", False):
+            app = Application.from_state(st.session_state)
+            to_generate, _ = app.plan(
+                regenerate_all=st.session_state.get("regenerate_all", False),
+                overwrite_edits=st.session_state.get("overwrite_edits", False),
+            )
+            similar = core.similar_drafts(app, to_generate)
+        for i, (score, _, draft) in similar.items():
+            st.checkbox(
+                f"Start '{section_name(i)}' from an earlier draft for a "
+                f"{score:.0%} similar input (instant, no AI call)",
+                value=False,
+                key=f"reuse_similar_{i}",
+            )
+            with st.expander(f"Preview the earlier {section_name(i)} draft"):
+                st.caption("Check names and details; it was written for another input.")
+                st.markdown(draft)
+        st.caption(
+            " | ".join(
+                [
+                    "Draft cache: {memory_hits} memory hits, {mongo_hits} shared "
+                    "hits, {misses} misses, {coalesced} joined in flight".format(
+                        **cache.stats
+                    ),
+                    "Tokens used: {total_tokens} in {calls} calls".format(
+                        **usage_totals()
+                    ),
+                    "OpenAI queue: {queued} waiting, last wait "
+                    "{last_wait_seconds:.1f} s".format(**scheduler_stats),
+                ]
+            )
+        )
+
+    submitted = False
     col1, col2, col3 = st.columns([1, 3, 1])
     with col1:
         if step > 0 and st.button("◀ Previous"):
@@ -163,20 +143,56 @@ def wizard_ui():
         if step < len(wizard_steps) - 1 and st.button("Next ▶"):
             st.session_state.step += 1
             st.rerun()
-        elif step == len(wizard_steps) - 1 and st.button(
-            "✅ Submit All & Generate Document"
-        ):
+        elif step == len(wizard_steps) - 1:
+            submitted = st.button("✅ Submit All & Generate Document")
+
+    if submitted:
+        app = Application.from_state(st.session_state)
+        to_generate, protected = app.plan(
+            regenerate_all=st.session_state.get("regenerate_all", False),
+            overwrite_edits=st.session_state.get("overwrite_edits", False),
+        )
+        if protected:
+            st.session_state["generation_notice"] = (
+                "Kept your edits to: "
+                + ", ".join(section_name(i) for i in protected)
+                + ". Tick 'Overwrite sections I have edited by hand' in the wizard "
+                "to regenerate them."
+            )
+        for i, (_, _, draft) in similar.items():
+            if i in to_generate and st.session_state.get(f"reuse_similar_{i}"):
+                app.record(i, draft)
+                to_generate.remove(i)
+        refresh = st.session_state.get("refresh_cache", False)
+        if st.session_state.get("stream_generation", True):
+            # Each section fills in its own placeholder as tokens arrive
+            errors = {}
+            placeholders = {}
+            for i in to_generate:
+                st.markdown(f"**{section_name(i)}**")
+                placeholders[i] = st.empty()
+                placeholders[i].caption("⏳ Waiting for AI...")
+            for kind, i, payload in core.stream(
+                app, to_generate, refresh=refresh, user=email
+            ):
+                if kind == "delta":
+                    placeholders[i].markdown(payload + " ▌")
+                elif kind == "done":
+                    placeholders[i].markdown(payload)
+                else:
+                    placeholders[i].caption("❌ Generation failed")
+                    errors[i] = payload
+        else:
             with st.spinner("Generating all content with AI..."):
-                for i in range(len(wizard_steps)):
-                    label = wizard_steps[i]
-                    user_input = st.session_state.get(f"step_{i}_input", "")
-                    ai_text = generate_from_ai(label, user_input)
-                    section_name = section_mapping.get(i, label)
-                    st.session_state[f"step_{i}_generated"] = ai_text
-                    st.session_state.edited_sections[section_name] = ai_text
-                st.session_state["wizard_complete"] = True
-                st.rerun();
-                # switch_page("Dashboard")
-
-
-wizard_ui()
+                errors = core.generate(app, to_generate, refresh=refresh, user=email)
+        app.to_state(st.session_state)
+        st.session_state["generation_errors"] = {
+            wizard_steps[i]: message for i, message in errors.items()
+        }
+        if not errors:
+            st.session_state["wizard_complete"] = True
+            st.rerun()
+
+    # Report failed sections individually; resubmitting retries them
+    for label, message in st.session_state.get("generation_errors", {}).items():
+        st.error(f"Could not generate '{label}': {message}")